@@ -0,0 +1,162 @@
+"""
+Compare generator backends (torch fp32 / int8 / onnx) on CPU.
+
+Each backend runs in its own subprocess so memory numbers are not mixed up.
+Reports load time, generation latency (p50/p95), resident memory after
+loading, and how often greedy outputs agree with the fp32 reference
+(exact match and token-level agreement).
+
+Usage:
+    python benchmark_backends.py
+    python benchmark_backends.py --backends torch int8 --prompts 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from generator_backends import GENERATOR_BACKENDS, load_generator
+from prompt_budget import INSTRUCTIONS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ONNX_CACHE_DIR = os.path.join(BASE_DIR, "onnx_cache")
+
+QUESTIONS = [
+    "Who is Maha Vishnu?",
+    "Why is Lord Dakshinamurthy called the supreme teacher?",
+    "What does the conch in Vishnu's hand represent?",
+    "Which direction does Dakshinamurthy face?",
+    "Who is the consort of Maha Vishnu?",
+]
+CONTEXT = (
+    "[Chunk 1] Maha Vishnu is the preserver in the Hindu trinity, resting on "
+    "the serpent Adishesha in Vaikuntha with his consort Lakshmi.\n\n"
+    "[Chunk 2] Lord Dakshinamurthy is Shiva as the supreme teacher, seated "
+    "under a banyan tree facing south, teaching the sages through silence.\n"
+)
+
+
+def make_prompts(n: int):
+    return [
+        f"{INSTRUCTIONS}\n{CONTEXT}\n\nConversation so far:\n\n"
+        f"User: {QUESTIONS[i % len(QUESTIONS)]}\n\nBot:"
+        for i in range(n)
+    ]
+
+
+def rss_mb() -> float:
+    """Resident set size of this process (Linux /proc, else peak RSS)."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(backend: str, num_prompts: int, max_new_tokens: int) -> dict:
+    """Load one backend and generate for every prompt (runs in a subprocess)."""
+    base_rss = rss_mb()
+    start = time.perf_counter()
+    generator = load_generator("distilgpt2", backend=backend, cache_dir=ONNX_CACHE_DIR)
+    load_s = time.perf_counter() - start
+    model_rss = rss_mb() - base_rss
+
+    tokenizer = generator.tokenizer
+    model = generator.model
+    latencies, outputs = [], []
+
+    prompts = make_prompts(num_prompts)
+    for i, prompt in enumerate([prompts[0]] + prompts):
+        inputs = tokenizer(prompt, return_tensors="pt")
+        t0 = time.perf_counter()
+        out = model.generate(
+            **inputs,
+            do_sample=False,
+            max_new_tokens=max_new_tokens,
+            pad_token_id=tokenizer.eos_token_id,
+        )
+        elapsed = (time.perf_counter() - t0) * 1000
+        if i == 0:
+            continue  # warm-up
+        latencies.append(elapsed)
+        outputs.append(out[0, inputs["input_ids"].shape[-1]:].tolist())
+
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "model_rss_mb": model_rss,
+        "latencies_ms": latencies,
+        "outputs": outputs,
+    }
+
+
+def token_agreement(a, b) -> float:
+    """Share of positions where two token sequences match (over the longer one)."""
+    length = max(len(a), len(b))
+    if length == 0:
+        return 1.0
+    return sum(1 for x, y in zip(a, b) if x == y) / length
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=list(GENERATOR_BACKENDS))
+    parser.add_argument("--prompts", type=int, default=10)
+    parser.add_argument("--max-new-tokens", type=int, default=40)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.prompts, args.max_new_tokens)))
+        return
+
+    results = {}
+    for backend in args.backends:
+        proc = subprocess.run(
+            [
+                sys.executable,
+                os.path.abspath(__file__),
+                "--worker", backend,
+                "--prompts", str(args.prompts),
+                "--max-new-tokens", str(args.max_new_tokens),
+            ],
+            capture_output=True,
+            text=True,
+            cwd=BASE_DIR,
+        )
+        if proc.returncode != 0:
+            print(f"{backend}: failed\n{proc.stderr.strip()[-2000:]}")
+            continue
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    reference = results.get("torch")
+    print(
+        f"{'backend':<8} {'load s':>7} {'RSS MB':>8} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'exact':>6} {'tokens':>7}"
+    )
+    for backend, r in results.items():
+        p50, p95 = np.percentile(r["latencies_ms"], [50, 95])
+        if reference is not None:
+            pairs = list(zip(reference["outputs"], r["outputs"]))
+            exact = np.mean([a == b for a, b in pairs])
+            tokens = np.mean([token_agreement(a, b) for a, b in pairs])
+            agreement = f"{exact:6.0%} {tokens:7.1%}"
+        else:
+            agreement = f"{'n/a':>6} {'n/a':>7}"
+        print(
+            f"{backend:<8} {r['load_s']:7.1f} {r['model_rss_mb']:8.1f} "
+            f"{p50:8.1f} {p95:8.1f} {agreement}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Throughput benchmark: simple_chunk_text() vs the streaming iter_chunks().
+
+Builds a synthetic corpus of the requested size (from the knowledge file if
+it exists, otherwise from generated paragraphs) and reports MB/s, chunk
+counts and peak Python memory for both chunkers.
+
+Usage:
+    python benchmark_chunker.py --size-mb 50
+    python benchmark_chunker.py --size-mb 50 --tokenizer   # use MiniLM tokenizer
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from chunking import (
+    iter_chunks,
+    load_embed_tokenizer,
+    load_knowledge_text,
+    simple_chunk_text,
+)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+KNOWLEDGE_FILE = os.path.join(BASE_DIR, "data", "deities_knowledge.txt")
+
+WORDS = (
+    "Vishnu preserver Dakshinamurthy teacher silence banyan tree wisdom "
+    "Vaikuntha Lakshmi conch discus avatar dharma sages knowledge south "
+    "facing Shiva trinity cosmic order devotion meditation"
+).split()
+
+
+def seed_paragraphs():
+    """Paragraphs used to build the corpus."""
+    if os.path.exists(KNOWLEDGE_FILE):
+        text = load_knowledge_text(KNOWLEDGE_FILE)
+        paras = [p.strip() for p in text.split("\n\n") if p.strip()]
+        if paras:
+            return paras
+
+    rng = random.Random(0)
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(30, 300))) + "."
+        for _ in range(200)
+    ]
+
+
+def build_corpus(path: str, size_mb: float) -> int:
+    """Write roughly size_mb of text; every paragraph gets a unique suffix."""
+    paras = seed_paragraphs()
+    target = int(size_mb * 1024 * 1024)
+    written = 0
+    i = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target:
+            para = f"{paras[i % len(paras)]} (section {i // len(paras)})\n\n"
+            f.write(para)
+            written += len(para.encode("utf-8"))
+            i += 1
+    return written
+
+
+def measure(label, fn, size_bytes):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    mb = size_bytes / (1024 * 1024)
+    print(
+        f"{label:<22} chunks={count:>8}  time={elapsed:8.2f}s  "
+        f"throughput={mb / elapsed:8.2f} MB/s  peak_mem={peak / (1024 * 1024):8.1f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=20.0)
+    parser.add_argument(
+        "--tokenizer",
+        action="store_true",
+        help="size windows with the embedding model tokenizer (needs transformers)",
+    )
+    parser.add_argument(
+        "--skip-old",
+        action="store_true",
+        help="skip simple_chunk_text (it is quadratic and very slow on big corpora)",
+    )
+    args = parser.parse_args()
+
+    tokenizer = load_embed_tokenizer() if args.tokenizer else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "corpus.txt")
+        size = build_corpus(path, args.size_mb)
+        print(f"Corpus: {size / (1024 * 1024):.1f} MB")
+
+        if not args.skip_old:
+            measure(
+                "simple_chunk_text",
+                lambda: len(simple_chunk_text(load_knowledge_text(path), max_chars=600)),
+                size,
+            )
+        measure(
+            "iter_chunks",
+            lambda: sum(1 for _ in iter_chunks(path, tokenizer=tokenizer)),
+            size,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Context-token savings of MMR diversification in retrieve_context().
+
+For every question it retrieves top_k chunks without and with MMR and
+reports the context tokens sent to the generator (counted with its
+tokenizer), how redundant the chunks are (mean pairwise cosine similarity)
+and, for labelled questions, recall@k. Uses the same JSONL question format
+as benchmark_rag.py.
+
+Usage:
+    python benchmark_mmr.py questions.jsonl --lambdas 0.3 0.5 0.7
+"""
+import argparse
+import itertools
+
+import numpy as np
+
+from benchmark_rag import load_questions, recall_at_k
+from rag_pipeline import (
+    get_embedding_fn,
+    get_query_cache,
+    get_token_counter,
+    retrieve_context,
+)
+
+
+def redundancy(documents) -> float:
+    """Mean pairwise cosine similarity of the chunks (0 for fewer than two)."""
+    if len(documents) < 2:
+        return 0.0
+    vecs = np.asarray(get_embedding_fn()(list(documents)), dtype=np.float32)
+    vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+    sims = [float(vecs[i] @ vecs[j]) for i, j in itertools.combinations(range(len(vecs)), 2)]
+    return float(np.mean(sims))
+
+
+def evaluate(questions, top_k: int, mmr_lambda):
+    counter = get_token_counter()
+    tokens, chunks, redundancies, recalls = [], [], [], []
+    for item in questions:
+        get_query_cache().clear()
+        documents = retrieve_context(item["question"], top_k=top_k, mmr_lambda=mmr_lambda)
+        tokens.append(sum(counter.count(f"[Chunk {i}] {doc}\n") for i, doc in enumerate(documents, 1)))
+        chunks.append(len(documents))
+        redundancies.append(redundancy(documents))
+        recall = recall_at_k(documents, item)
+        if recall is not None:
+            recalls.append(recall)
+    return {
+        "tokens": float(np.mean(tokens)),
+        "chunks": float(np.mean(chunks)),
+        "redundancy": float(np.mean(redundancies)),
+        "recall": float(np.mean(recalls)) if recalls else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("questions", help="JSONL question file")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--lambdas", type=float, nargs="+", default=[0.5])
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    baseline = evaluate(questions, args.top_k, False)
+
+    print(f"{'mode':<12} {'ctx tokens':>10} {'saved':>7} {'chunks':>7} {'redund.':>8} {'recall':>7}")
+    rows = [("no MMR", baseline)] + [
+        (f"MMR λ={lam:g}", evaluate(questions, args.top_k, lam)) for lam in args.lambdas
+    ]
+    for label, r in rows:
+        saved = 1 - r["tokens"] / baseline["tokens"] if baseline["tokens"] else 0.0
+        recall = f"{r['recall']:.3f}" if r["recall"] is not None else "n/a"
+        print(
+            f"{label:<12} {r['tokens']:10.1f} {saved:7.1%} {r['chunks']:7.2f} "
+            f"{r['redundancy']:8.3f} {recall:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
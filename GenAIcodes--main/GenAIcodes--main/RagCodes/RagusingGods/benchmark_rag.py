@@ -0,0 +1,181 @@
+"""
+Latency / recall benchmark for the headless RAG pipeline.
+
+Replays a question file through retrieve_context() and generate_bot_reply()
+and reports p50/p95/p99 per stage, queries/sec and recall@k (and, with
+--compress, the context tokens saved by compress_context()).
+
+The question file is JSONL, one question per line:
+
+    {"question": "Who is Maha Vishnu?",
+     "relevant_ids": ["chunk-..."],             # optional, ids from ingestion
+     "relevant_texts": ["preserver of the universe"]}  # optional substrings
+
+A retrieved chunk counts as relevant if its id is in relevant_ids or it
+contains one of relevant_texts. Questions without labels are timed only.
+
+Usage:
+    python benchmark_rag.py questions.jsonl --top-k 3
+    python benchmark_rag.py questions.jsonl --no-generate --no-cache
+    python benchmark_rag.py questions.jsonl --compress
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from rag_pipeline import (
+    build_prompt_from_history,
+    chunk_id,
+    compress_context,
+    generate_bot_reply,
+    get_generation_worker,
+    get_query_cache,
+    get_retriever,
+    get_token_counter,
+    retrieve_context,
+)
+
+
+def load_questions(path: str):
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                questions.append(json.loads(line))
+    return questions
+
+
+def recall_at_k(documents, item) -> float:
+    """Fraction of labelled chunks found in the retrieved documents (None if unlabelled)."""
+    relevant_ids = set(item.get("relevant_ids", []))
+    relevant_texts = item.get("relevant_texts", [])
+    total = len(relevant_ids) + len(relevant_texts)
+    if total == 0:
+        return None
+
+    retrieved_ids = {chunk_id(doc) for doc in documents}
+    found = len(relevant_ids & retrieved_ids)
+    found += sum(1 for t in relevant_texts if any(t in doc for doc in documents))
+    return found / total
+
+
+def percentiles(values_ms):
+    arr = np.asarray(values_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return p50, p95, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("questions", help="JSONL question file")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=1, help="replay the file N times")
+    parser.add_argument("--no-generate", action="store_true", help="retrieval only")
+    parser.add_argument(
+        "--rerank", action="store_true", help="re-rank candidates with the cross-encoder"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="clear the query cache before each question"
+    )
+    parser.add_argument(
+        "--compress", action="store_true", help="compress the context before generation"
+    )
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions) * args.repeat
+
+    # Load everything up front so start-up cost is not counted as latency
+    get_retriever()
+    if not args.no_generate:
+        get_generation_worker()
+
+    stages = {"retrieve": [], "prompt": [], "generate": [], "total": []}
+    ttft = []
+    recalls = []
+    saved_tokens = []
+
+    wall_start = time.perf_counter()
+    for item in questions:
+        if args.no_cache:
+            get_query_cache().clear()
+
+        t0 = time.perf_counter()
+        documents, query_embedding = retrieve_context(
+            item["question"], top_k=args.top_k, rerank=args.rerank, return_embedding=True
+        )
+        t1 = time.perf_counter()
+        stages["retrieve"].append((t1 - t0) * 1000)
+        retrieved = documents
+
+        if args.compress:
+            documents, _, compression = compress_context(
+                item["question"], documents, query_embedding=query_embedding
+            )
+            saved_tokens.append(compression["tokens_saved"])
+            t1 = time.perf_counter()
+            stages.setdefault("compress", []).append((t1 - t0) * 1000 - stages["retrieve"][-1])
+
+        if not args.no_generate:
+            # Prompt assembly on its own (generate_bot_reply builds it again)
+            build_prompt_from_history(
+                [], item["question"], documents, counter=get_token_counter()
+            )
+            t2 = time.perf_counter()
+            stages["prompt"].append((t2 - t1) * 1000)
+
+            metrics = {}
+            generate_bot_reply([], item["question"], documents, metrics=metrics)
+            t3 = time.perf_counter()
+            stages["generate"].append((t3 - t2) * 1000)
+            ttft.append(metrics["ttft_s"] * 1000)
+            stages["total"].append((t3 - t0) * 1000 - stages["prompt"][-1])
+        else:
+            stages["total"].append((t1 - t0) * 1000)
+
+        # Scored outside the timed stages
+        recall = recall_at_k(retrieved, item)
+        if recall is not None:
+            recalls.append(recall)
+    wall = time.perf_counter() - wall_start
+
+    report = {"questions": len(questions), "qps": len(questions) / wall if wall else 0.0}
+    if ttft:
+        stages["ttft"] = ttft
+    for name, values in stages.items():
+        if values:
+            p50, p95, p99 = percentiles(values)
+            report[name] = {"p50_ms": p50, "p95_ms": p95, "p99_ms": p99}
+    if recalls:
+        report[f"recall@{args.top_k}"] = float(np.mean(recalls))
+        report["labelled_questions"] = len(recalls)
+    if saved_tokens:
+        report["context_tokens_saved_mean"] = float(np.mean(saved_tokens))
+    report["cache"] = get_query_cache().snapshot_stats()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Questions: {report['questions']}   QPS: {report['qps']:.2f}")
+    for name in ("retrieve", "compress", "prompt", "generate", "ttft", "total"):
+        if name in report:
+            r = report[name]
+            print(
+                f"  {name:<9} p50={r['p50_ms']:8.1f} ms  "
+                f"p95={r['p95_ms']:8.1f} ms  p99={r['p99_ms']:8.1f} ms"
+            )
+    if recalls:
+        print(
+            f"  recall@{args.top_k}: {report[f'recall@{args.top_k}']:.3f} "
+            f"over {len(recalls)} labelled questions"
+        )
+    if saved_tokens:
+        print(f"  context tokens saved: {report['context_tokens_saved_mean']:.1f} per question")
+
+
+if __name__ == "__main__":
+    main()
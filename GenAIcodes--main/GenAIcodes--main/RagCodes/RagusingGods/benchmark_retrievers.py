@@ -0,0 +1,129 @@
+"""
+Compare dense retriever backends (chroma / faiss) on our corpus.
+
+Each backend runs in its own subprocess so memory numbers are not mixed up.
+Reports index load time, resident memory added by the index, dense search
+latency (p50/p95, query embedding excluded) and recall@k against an exact
+brute-force search over the same embeddings. With a labelled question file
+(see benchmark_rag.py) it also reports recall@k against the labels.
+
+Without a question file, the first sentence of every chunk is used as a
+query.
+
+Usage:
+    python benchmark_retrievers.py
+    python benchmark_retrievers.py questions.jsonl --top-k 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from retrievers import RETRIEVER_BACKENDS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_worker(backend: str, questions_path: str, top_k: int) -> dict:
+    """Load one backend and time its searches (runs in a subprocess)."""
+    os.environ["RAG_RETRIEVER_BACKEND"] = backend
+    from benchmark_backends import rss_mb
+    from benchmark_rag import load_questions, recall_at_k
+    from context_compression import split_sentences
+    from rag_pipeline import get_embedding_fn, get_retriever
+
+    # Embedding model first, so its memory is not counted as the index's
+    embed = get_embedding_fn()
+    embed(["warm-up"])
+
+    base_rss = rss_mb()
+    start = time.perf_counter()
+    retriever = get_retriever()
+    load_s = time.perf_counter() - start
+    index_rss = rss_mb() - base_rss
+
+    ids, documents = retriever.all_documents()
+    if questions_path:
+        items = load_questions(questions_path)
+    else:
+        items = [{"question": split_sentences(doc)[0]} for doc in documents if doc.strip()]
+    query_vecs = np.asarray(embed([item["question"] for item in items]), dtype=np.float32)
+
+    # Exact L2 neighbours over the stored embeddings are the reference
+    stored = retriever.fetch(ids, include_embeddings=True)
+    matrix = np.asarray(stored["embeddings"], dtype=np.float32)
+    dists = (
+        (query_vecs ** 2).sum(axis=1)[:, None]
+        - 2 * query_vecs @ matrix.T
+        + (matrix ** 2).sum(axis=1)[None, :]
+    )
+    exact = np.argsort(dists, axis=1)[:, :top_k]
+
+    latencies, ann_recalls, label_recalls = [], [], []
+    for i, (item, vec) in enumerate(zip(items, query_vecs)):
+        t0 = time.perf_counter()
+        result = retriever.search(vec, top_k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+        expected = {stored["ids"][row] for row in exact[i]}
+        ann_recalls.append(len(expected & set(result["ids"])) / len(expected))
+        recall = recall_at_k(result["documents"], item)
+        if recall is not None:
+            label_recalls.append(recall)
+
+    return {
+        "backend": backend,
+        "chunks": len(ids),
+        "queries": len(items),
+        "load_s": load_s,
+        "index_rss_mb": index_rss,
+        "latencies_ms": latencies,
+        "recall_vs_exact": float(np.mean(ann_recalls)),
+        "recall_labelled": float(np.mean(label_recalls)) if label_recalls else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("questions", nargs="?", help="optional JSONL question file")
+    parser.add_argument("--backends", nargs="+", default=list(RETRIEVER_BACKENDS))
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.questions, args.top_k)))
+        return
+
+    results = {}
+    for backend in args.backends:
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", backend]
+        cmd += ["--top-k", str(args.top_k)]
+        if args.questions:
+            cmd.append(os.path.abspath(args.questions))
+        proc = subprocess.run(cmd, capture_output=True, text=True, cwd=BASE_DIR)
+        if proc.returncode != 0:
+            print(f"{backend}: failed\n{proc.stderr.strip()[-2000:]}")
+            continue
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    k = args.top_k
+    print(
+        f"{'backend':<8} {'chunks':>7} {'load s':>7} {'RSS MB':>8} {'p50 ms':>8} "
+        f"{'p95 ms':>8} {f'R@{k} exact':>11} {f'R@{k} labels':>12}"
+    )
+    for backend, r in results.items():
+        p50, p95 = np.percentile(r["latencies_ms"], [50, 95])
+        labelled = f"{r['recall_labelled']:.3f}" if r["recall_labelled"] is not None else "n/a"
+        print(
+            f"{backend:<8} {r['chunks']:7d} {r['load_s']:7.2f} {r['index_rss_mb']:8.1f} "
+            f"{p50:8.3f} {p95:8.3f} {r['recall_vs_exact']:11.3f} {labelled:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import json
+import os
+import re
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+# -------------------------------------------------------------------
+# Lexical (BM25) index over the knowledge chunks.
+#
+# BM25 weights are precomputed into a sparse term x document matrix, so
+# scoring a query is one sparse row-slice + sum, however many chunks there
+# are. The index is saved next to the Chroma data and rebuilt only when the
+# collection version or content hash changes.
+# -------------------------------------------------------------------
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str):
+    """Lowercased word tokens (keeps names/epithets intact)."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """BM25 over a fixed set of chunks, stored as a sparse CSR matrix."""
+
+    def __init__(self, ids, vocab, weights, version=0, content_hash=None):
+        """
+        :param ids:          Chunk ids, one per matrix column.
+        :param vocab:        term -> row index in weights.
+        :param weights:      CSR matrix (num_terms x num_docs) of BM25 weights.
+        :param version:      Collection version the index was built from.
+        :param content_hash: Hash of the chunk-id set it was built from.
+        """
+        self.ids = list(ids)
+        self.vocab = vocab
+        self.weights = weights
+        self.version = version
+        self.content_hash = content_hash
+
+    @classmethod
+    def build(
+        cls,
+        ids,
+        documents,
+        version=0,
+        content_hash=None,
+        k1: float = 1.5,
+        b: float = 0.75
+    ):
+        """Build the index from chunk ids and their texts."""
+        vocab = {}
+        rows, cols, tfs = [], [], []
+        doc_lens = np.zeros(len(documents), dtype=np.float32)
+
+        for doc_idx, text in enumerate(documents):
+            counts = Counter(tokenize(text))
+            doc_lens[doc_idx] = sum(counts.values())
+            for term, tf in counts.items():
+                rows.append(vocab.setdefault(term, len(vocab)))
+                cols.append(doc_idx)
+                tfs.append(tf)
+
+        num_terms, num_docs = len(vocab), len(documents)
+        tf = np.asarray(tfs, dtype=np.float32)
+        rows = np.asarray(rows, dtype=np.int32)
+        cols = np.asarray(cols, dtype=np.int32)
+
+        # Document frequency per term and the BM25 idf
+        df = np.bincount(rows, minlength=num_terms).astype(np.float32)
+        idf = np.log1p((num_docs - df + 0.5) / (df + 0.5))
+
+        avgdl = doc_lens.mean() if num_docs else 1.0
+        norm = k1 * (1 - b + b * doc_lens[cols] / max(avgdl, 1e-9))
+        data = idf[rows] * tf * (k1 + 1) / (tf + norm)
+
+        weights = sparse.csr_matrix(
+            (data, (rows, cols)), shape=(num_terms, num_docs), dtype=np.float32
+        )
+        return cls(ids, vocab, weights, version, content_hash)
+
+    def search(self, query: str, top_k: int = 10):
+        """Return [(chunk_id, score)] for the best top_k chunks with score > 0."""
+        term_rows = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+        if not term_rows or not self.ids:
+            return []
+
+        scores = np.asarray(self.weights[term_rows].sum(axis=0)).ravel()
+        k = min(top_k, scores.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+
+    def save(self, directory: str, name: str = "bm25") -> None:
+        os.makedirs(directory, exist_ok=True)
+        sparse.save_npz(os.path.join(directory, f"{name}_weights.npz"), self.weights)
+        meta_path = os.path.join(directory, f"{name}_meta.json")
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": self.version,
+                    "content_hash": self.content_hash,
+                    "ids": self.ids,
+                    "vocab": self.vocab,
+                },
+                f,
+            )
+        os.replace(tmp_path, meta_path)
+
+    @classmethod
+    def load(cls, directory: str, name: str = "bm25"):
+        """Load a saved index, or return None if it is missing or unreadable."""
+        meta_path = os.path.join(directory, f"{name}_meta.json")
+        weights_path = os.path.join(directory, f"{name}_weights.npz")
+        if not (os.path.exists(meta_path) and os.path.exists(weights_path)):
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            weights = sparse.load_npz(weights_path).tocsr()
+        except (OSError, ValueError, json.JSONDecodeError):
+            return None
+        return cls(
+            meta["ids"], meta["vocab"], weights, meta.get("version", 0), meta.get("content_hash")
+        )
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60):
+    """
+    Merge several ranked id lists: score(id) = sum(1 / (k + rank)).
+
+    Returns ids sorted by fused score, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
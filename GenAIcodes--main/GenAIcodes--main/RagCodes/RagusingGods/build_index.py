@@ -0,0 +1,77 @@
+"""
+Build the prebuilt index snapshot the app loads at startup.
+
+Chunks the knowledge file exactly like the app does (same chunker and
+near-duplicate settings), embeds the chunks in batches and writes
+chunks.jsonl, embeddings.npy and manifest.json to index_snapshot/ (see
+index_snapshot.py). Run it again whenever the knowledge file, the
+embedding model or the chunker settings change; until then the app
+falls back to embedding at startup.
+
+Usage:
+    python build_index.py
+    python build_index.py --knowledge data/deities_knowledge.txt --out index_snapshot
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from index_snapshot import EMBEDDINGS_NAME, open_embeddings, write_snapshot
+from rag_pipeline import (
+    INGEST_BATCH_SIZE,
+    KNOWLEDGE_FILE,
+    SNAPSHOT_DIR,
+    chunk_metadata,
+    file_sha256,
+    get_embedding_fn,
+    iter_ingest_chunks,
+    snapshot_key,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--knowledge", default=KNOWLEDGE_FILE, help="knowledge text file")
+    parser.add_argument("--out", default=SNAPSHOT_DIR, help="snapshot directory")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    dropped = {}
+    ids, chunks = [], []
+    for cid, chunk in iter_ingest_chunks(args.knowledge, dropped):
+        ids.append(cid)
+        chunks.append(chunk)
+    chunked = time.perf_counter()
+    if not chunks:
+        raise SystemExit(f"No chunks found in {args.knowledge}")
+
+    source = os.path.basename(args.knowledge)
+    metadatas = [chunk_metadata(source, dropped.get(cid, [])) for cid in ids]
+
+    embed = get_embedding_fn()
+    embeddings = None
+    for lo in range(0, len(chunks), args.batch_size):
+        batch = np.asarray(embed(chunks[lo:lo + args.batch_size]), dtype=np.float32)
+        if embeddings is None:
+            embeddings = open_embeddings(args.out, len(chunks), batch.shape[1])
+        embeddings[lo:lo + len(batch)] = batch
+    embedded = time.perf_counter()
+
+    manifest = write_snapshot(
+        args.out, ids, chunks, metadatas, embeddings, snapshot_key(file_sha256(args.knowledge))
+    )
+
+    size_mb = os.path.getsize(os.path.join(args.out, EMBEDDINGS_NAME)) / 1e6
+    print(f"Snapshot written to {args.out}")
+    print(f"  model:    {manifest['model']}")
+    print(f"  corpus:   {manifest['source_hash'][:16]}…  ({manifest['chunker']})")
+    print(f"  chunks:   {manifest['count']} x {manifest['dim']} float32 ({size_mb:.1f} MB)")
+    print(f"  near-duplicates dropped: {sum(len(v) for v in dropped.values())}")
+    print(f"  chunking {chunked - start:.1f}s, embedding {embedded - chunked:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
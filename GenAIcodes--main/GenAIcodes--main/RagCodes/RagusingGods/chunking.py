@@ -0,0 +1,170 @@
+import os
+import re
+import textwrap
+
+# -------------------------------------------------------------------
+# Chunking utilities for the knowledge file.
+#
+# iter_chunks() is what ingestion uses: it reads the file line by line,
+# never holds more than one paragraph in memory and yields token-sized
+# windows. simple_chunk_text() is the original whole-file version, kept
+# for benchmark_chunker.py.
+# -------------------------------------------------------------------
+
+# Tokenizer of the embedding model (all-MiniLM-L6-v2 truncates at 256 tokens)
+EMBED_TOKENIZER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_MAX_TOKENS = 200
+DEFAULT_OVERLAP_TOKENS = 40
+
+# A paragraph without blank lines is flushed once it gets this big; a longer
+# single line is split at that boundary
+MAX_PARAGRAPH_CHARS = 64 * 1024
+
+_WORD_RE = re.compile(r"\S+")
+
+
+def load_knowledge_text(path: str) -> str:
+    """Read the full text file with Dakshinamurthy + Maha Vishnu content."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"Knowledge file not found at: {path}\n"
+            "Make sure data/deities_knowledge.txt exists."
+        )
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def simple_chunk_text(text: str, max_chars: int = 600):
+    """
+    Very simple chunking: split by blank lines, then further split long
+    paragraphs into smaller pieces.
+    """
+    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
+    chunks = []
+
+    for para in paragraphs:
+        if len(para) <= max_chars:
+            chunks.append(para)
+        else:
+            # wrap long paragraph into smaller parts
+            wrapped = textwrap.wrap(para, width=max_chars)
+            chunks.extend(wrapped)
+
+    # ensure uniqueness and non-empty
+    cleaned = []
+    for c in chunks:
+        c = c.strip()
+        if c and c not in cleaned:
+            cleaned.append(c)
+
+    return cleaned
+
+
+def load_embed_tokenizer(name: str = EMBED_TOKENIZER_NAME):
+    """Load the (fast) tokenizer that matches the embedding model."""
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(name, use_fast=True)
+
+
+def iter_paragraphs(path: str, buffer_size: int = 1 << 20):
+    """
+    Yield paragraphs (blank-line separated) from a file without reading it whole.
+
+    Lines are read through a buffered reader, so memory stays at one paragraph
+    (capped by MAX_PARAGRAPH_CHARS) no matter how big the file is. A line
+    longer than what is left of the cap is read in pieces, so it is never
+    held whole either.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"Knowledge file not found at: {path}\n"
+            "Make sure data/deities_knowledge.txt exists."
+        )
+
+    lines = []
+    size = 0
+    with open(path, "r", encoding="utf-8", buffering=buffer_size) as f:
+        while True:
+            line = f.readline(MAX_PARAGRAPH_CHARS - size)
+            if not line:
+                break
+            if line.strip():
+                lines.append(line)
+                size += len(line)
+                if size < MAX_PARAGRAPH_CHARS:
+                    continue
+            if lines:
+                para = "".join(lines).strip()
+                lines = []
+                size = 0
+                if para:
+                    yield para
+
+    if lines:
+        para = "".join(lines).strip()
+        if para:
+            yield para
+
+
+def _token_spans(text: str, tokenizer):
+    """Return (start, end) character offsets for each token of text."""
+    if tokenizer is None:
+        # Whitespace fallback when no tokenizer is available
+        return [m.span() for m in _WORD_RE.finditer(text)]
+
+    encoded = tokenizer(
+        text,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        return_attention_mask=False,
+        verbose=False,
+    )
+    return encoded["offset_mapping"]
+
+
+def window_paragraph(
+    para: str,
+    tokenizer=None,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+):
+    """
+    Split one paragraph into sliding windows of at most max_tokens tokens,
+    each overlapping the previous one by overlap_tokens. Text is sliced from
+    the original paragraph using token offsets, so no detokenizing is needed.
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+
+    spans = _token_spans(para, tokenizer)
+    if len(spans) <= max_tokens:
+        yield para
+        return
+
+    stride = max_tokens - overlap_tokens
+    for start in range(0, len(spans), stride):
+        window = spans[start:start + max_tokens]
+        yield para[window[0][0]:window[-1][1]].strip()
+        if start + max_tokens >= len(spans):
+            break
+
+
+def iter_chunks(
+    path: str,
+    tokenizer=None,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+):
+    """
+    Streaming replacement for simple_chunk_text(load_knowledge_text(path)).
+
+    Yields non-empty chunks in file order, holding no state across
+    paragraphs. Exact repeats are left to the caller: ingestion drops them
+    by chunk id (see rag_pipeline.iter_ingest_chunks), where the ids are
+    kept for the manifest anyway.
+    """
+    for para in iter_paragraphs(path):
+        for chunk in window_paragraph(para, tokenizer, max_tokens, overlap_tokens):
+            if chunk:
+                yield chunk
@@ -0,0 +1,100 @@
+import re
+
+import numpy as np
+
+# -------------------------------------------------------------------
+# Extractive context compression.
+#
+# Retrieved chunks are split into sentences, and the query plus every
+# sentence are embedded in one batched call. The sentences most similar to
+# the query are kept until the token budget is used up. The kept sentences
+# stay grouped under the chunk they came from, in their original order, so
+# each "[Chunk i]" in the prompt still cites one chunk id.
+# -------------------------------------------------------------------
+
+# Split on whitespace after ., ! or ? (optionally followed by a closing
+# quote/bracket); newlines always end a sentence.
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|(?<=[.!?][\"')\]])\s+|\n+")
+
+
+def split_sentences(text: str):
+    """Non-empty, stripped sentences of text, in order."""
+    return [s.strip() for s in _SENTENCE_RE.split(text) if s and s.strip()]
+
+
+def context_line(i: int, text: str) -> str:
+    """How build_prompt_from_history writes a chunk into the prompt."""
+    return f"[Chunk {i}] {text}\n"
+
+
+def compress_chunks(
+    query, chunk_ids, chunks, embed_fn, counter, token_budget: int, query_embedding=None
+):
+    """
+    Keep the query-relevant sentences of the chunks within token_budget.
+
+    :param query:        User question.
+    :param chunk_ids:    Id of each chunk (kept for citations).
+    :param chunks:       Retrieved chunk texts, best first.
+    :param embed_fn:     Callable mapping a list of texts to embeddings.
+    :param counter:      prompt_budget.TokenCounter for the generator.
+    :param token_budget: Max tokens for the context lines in the prompt.
+    :param query_embedding: The query's embedding if already computed
+                         (then only the sentences are embedded).
+    :return: (texts, ids, stats) where texts/ids are the compressed chunks
+             that still have sentences, and stats holds token counts before
+             and after plus how many sentences were kept.
+    """
+    tokens_before = sum(counter.count(context_line(i, c)) for i, c in enumerate(chunks, 1))
+
+    # (chunk index, sentence) for every sentence of every chunk
+    sentences = [(ci, s) for ci, chunk in enumerate(chunks) for s in split_sentences(chunk)]
+    stats = {
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_before,
+        "tokens_saved": 0,
+        "sentences": len(sentences),
+        "sentences_kept": len(sentences),
+    }
+    if not sentences:
+        return list(chunks), list(chunk_ids), stats
+
+    if query_embedding is None:
+        vectors = np.asarray(embed_fn([query] + [s for _, s in sentences]), dtype=np.float32)
+    else:
+        vectors = np.vstack([
+            np.asarray(query_embedding, dtype=np.float32).ravel(),
+            np.asarray(embed_fn([s for _, s in sentences]), dtype=np.float32),
+        ])
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    scores = vectors[1:] @ vectors[0]
+
+    # Greedy by score; a sentence too long for what is left is skipped so a
+    # shorter, slightly less relevant one can still fit.
+    kept = set()
+    used = 0
+    for idx in np.argsort(-scores, kind="stable"):
+        cost = counter.count(sentences[idx][1]) + 1
+        if used + cost <= token_budget:
+            kept.add(int(idx))
+            used += cost
+    if not kept:
+        return list(chunks), list(chunk_ids), stats
+
+    grouped = {}
+    for idx in sorted(kept):
+        ci, sentence = sentences[idx]
+        grouped.setdefault(ci, []).append(sentence)
+
+    texts, ids = [], []
+    for ci in sorted(grouped):
+        texts.append(" ".join(grouped[ci]))
+        ids.append(chunk_ids[ci])
+
+    tokens_after = sum(counter.count(context_line(i, t)) for i, t in enumerate(texts, 1))
+    stats.update(
+        tokens_after=tokens_after,
+        tokens_saved=tokens_before - tokens_after,
+        sentences_kept=len(kept),
+    )
+    return texts, ids, stats
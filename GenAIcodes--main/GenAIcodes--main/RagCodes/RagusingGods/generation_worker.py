@@ -0,0 +1,270 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+
+# -------------------------------------------------------------------
+# Single generation worker shared by every session.
+#
+# Sessions submit prompts to a queue instead of calling the model from their
+# own threads. The worker takes the first waiting request, keeps collecting
+# for up to max_wait_ms (or until max_batch_size), and decodes the whole
+# group as one left-padded batch. Each request streams its own text back
+# through a per-request queue and gets its stats through a Future.
+# -------------------------------------------------------------------
+
+STOP_MARKERS = ["User:", "Bot:"]
+
+
+class StopOnMarkers(StoppingCriteria):
+    """
+    Stop decoding a row as soon as its generated text contains a stop marker.
+
+    Returns one flag per batch row, so finished rows stop while the others
+    keep going. Also records when the first token was produced and how many
+    tokens each row generated (for time-to-first-token and tokens/sec).
+    """
+
+    def __init__(self, tokenizer, prompt_len, markers=STOP_MARKERS):
+        self.tokenizer = tokenizer
+        self.prompt_len = prompt_len
+        self.markers = markers
+        # Only the last few tokens can complete a marker
+        self.tail_tokens = 8
+        self.first_token_time = None
+        self.num_tokens = None
+        self._done = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        batch_size, length = input_ids.shape
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+            self.num_tokens = [0] * batch_size
+            self._done = [False] * batch_size
+
+        start = max(self.prompt_len, length - self.tail_tokens)
+        for row in range(batch_size):
+            if self._done[row]:
+                continue
+            self.num_tokens[row] = length - self.prompt_len
+            tail = self.tokenizer.decode(input_ids[row, start:], skip_special_tokens=True)
+            if any(marker in tail for marker in self.markers):
+                self._done[row] = True
+
+        return torch.tensor(self._done, dtype=torch.bool, device=input_ids.device)
+
+
+class GenerationHandle:
+    """
+    What submit() returns: iterate it for streamed text pieces, then call
+    result() for the stats dict.
+    """
+
+    _END = object()
+
+    def __init__(self, prompt: str, max_new_tokens: int):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.enqueued_at = time.perf_counter()
+        self.future = Future()
+        self._pieces = queue.Queue()
+
+    def _push(self, piece: str) -> None:
+        self._pieces.put(piece)
+
+    def _close(self) -> None:
+        self._pieces.put(self._END)
+
+    def __iter__(self):
+        while True:
+            piece = self._pieces.get()
+            if piece is self._END:
+                return
+            yield piece
+
+    def result(self, timeout=None) -> dict:
+        return self.future.result(timeout)
+
+
+class _BatchStreamer(BaseStreamer):
+    """Routes each row's new tokens to its own GenerationHandle as text."""
+
+    def __init__(self, tokenizer, handles):
+        self.tokenizer = tokenizer
+        self.handles = handles
+        self.tokens = [[] for _ in handles]
+        self.sent = [""] * len(handles)
+        self._seen_prompt = False
+
+    def put(self, value):
+        if not self._seen_prompt:
+            # generate() first passes the prompt ids; those are not output
+            self._seen_prompt = True
+            return
+
+        value = value.reshape(len(self.handles), -1)
+        for row, handle in enumerate(self.handles):
+            self.tokens[row].extend(value[row].tolist())
+            text = self.tokenizer.decode(self.tokens[row], skip_special_tokens=True)
+            # Hold back an incomplete multi-byte character
+            if text.endswith("�"):
+                continue
+            if len(text) > len(self.sent[row]):
+                handle._push(text[len(self.sent[row]):])
+                self.sent[row] = text
+
+    def end(self):
+        for row, handle in enumerate(self.handles):
+            text = self.tokenizer.decode(self.tokens[row], skip_special_tokens=True)
+            if len(text) > len(self.sent[row]):
+                handle._push(text[len(self.sent[row]):])
+            handle._close()
+
+
+class BatchingGenerator:
+    """Owns the model; groups requests arriving close together into one batch."""
+
+    def __init__(
+        self,
+        generator,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        prefix_cache=None,
+    ):
+        """
+        :param generator:      text-generation pipeline (model + tokenizer).
+        :param max_batch_size: Max requests decoded together.
+        :param max_wait_ms:    How long to wait for more requests after the first.
+        :param prefix_cache:   Optional PrefixCache, used when a batch has one request
+                               (padded batches cannot share one prefix cache).
+        """
+        self.model = generator.model
+        self.tokenizer = generator.tokenizer
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.prefix_cache = prefix_cache
+
+        self._queue = queue.Queue()
+        self._metrics_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._requests = 0
+        self._max_queue_depth = 0
+
+        self._thread = threading.Thread(
+            target=self._run, name="generation-worker", daemon=True
+        )
+        self._thread.start()
+
+    # -----------------------------
+    # Client side
+    # -----------------------------
+
+    def submit(self, prompt: str, max_new_tokens: int) -> GenerationHandle:
+        handle = GenerationHandle(prompt, max_new_tokens)
+        self._queue.put(handle)
+        with self._metrics_lock:
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return handle
+
+    def snapshot_metrics(self) -> dict:
+        """Queue depth and batch size distribution, for sizing under load."""
+        with self._metrics_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "requests": self._requests,
+                "batches": batches,
+                "avg_batch_size": round(self._requests / batches, 2) if batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+            }
+
+    # -----------------------------
+    # Worker side
+    # -----------------------------
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            with self._metrics_lock:
+                self._batch_sizes[len(batch)] += 1
+                self._requests += len(batch)
+            try:
+                self._generate(batch)
+            except Exception as exc:  # keep the worker alive for other requests
+                for handle in batch:
+                    handle._close()
+                    if not handle.future.done():
+                        handle.future.set_exception(exc)
+
+    def _generate(self, batch):
+        started = time.perf_counter()
+        past_key_values = None
+
+        if len(batch) == 1 and self.prefix_cache is not None:
+            inputs, past_key_values = self.prefix_cache.build_inputs(
+                self.tokenizer, batch[0].prompt
+            )
+        else:
+            inputs = dict(
+                self.tokenizer(
+                    [handle.prompt for handle in batch],
+                    return_tensors="pt",
+                    padding=True,
+                )
+            )
+        inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
+
+        prompt_len = inputs["input_ids"].shape[-1]
+        stopper = StopOnMarkers(self.tokenizer, prompt_len=prompt_len)
+        streamer = _BatchStreamer(self.tokenizer, batch)
+
+        generate_kwargs = dict(
+            **inputs,
+            do_sample=False,        # greedy decoding (no randomness)
+            max_new_tokens=max(handle.max_new_tokens for handle in batch),
+            streamer=streamer,
+            stopping_criteria=StoppingCriteriaList([stopper]),
+            pad_token_id=self.tokenizer.pad_token_id,
+        )
+        if past_key_values is not None:
+            generate_kwargs["past_key_values"] = past_key_values
+
+        with torch.no_grad():
+            self.model.generate(**generate_kwargs)
+        finished = time.perf_counter()
+
+        first = stopper.first_token_time or finished
+        for row, handle in enumerate(batch):
+            handle.future.set_result(
+                {
+                    "queue_wait_s": started - handle.enqueued_at,
+                    "ttft_s": first - handle.enqueued_at,
+                    "decode_s": finished - first,
+                    "num_tokens": stopper.num_tokens[row] if stopper.num_tokens else 0,
+                    "prompt_tokens": int(inputs["attention_mask"][row].sum()),
+                    "batch_size": len(batch),
+                }
+            )
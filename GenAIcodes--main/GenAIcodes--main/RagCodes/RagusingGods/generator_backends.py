@@ -0,0 +1,109 @@
+import os
+
+import torch
+from torch import nn
+from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers.pipelines import pipeline
+
+# -------------------------------------------------------------------
+# CPU inference backends for the RAG generator.
+#
+# Every backend returns a regular text-generation pipeline, so callers keep
+# using generator.model.generate(...) and generator.tokenizer:
+#
+#   torch  - plain fp32 PyTorch (the original behaviour)
+#   int8   - dynamic int8 quantization of the linear layers
+#   onnx   - ONNX Runtime export (via optimum) with the optimized graph
+#            cached on disk, so optimization only happens on the first load
+# -------------------------------------------------------------------
+
+GENERATOR_BACKENDS = ("torch", "int8", "onnx")
+
+
+def conv1d_to_linear(model):
+    """
+    Replace GPT-2 style Conv1D layers with equivalent nn.Linear layers.
+
+    distilgpt2 implements its attention/MLP projections as transformers'
+    Conv1D (weight stored as in x out), which dynamic quantization does not
+    recognise. nn.Linear with the transposed weight computes the same thing.
+    """
+    from transformers.pytorch_utils import Conv1D
+
+    for name, child in model.named_children():
+        if isinstance(child, Conv1D):
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(model, name, linear)
+        else:
+            conv1d_to_linear(child)
+    return model
+
+
+def load_torch_model(model_name: str):
+    return AutoModelForCausalLM.from_pretrained(model_name).eval()
+
+
+def load_int8_model(model_name: str):
+    """fp32 model with every linear projection dynamically quantized to int8."""
+    model = conv1d_to_linear(load_torch_model(model_name))
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def load_onnx_model(model_name: str, cache_dir: str):
+    """
+    ONNX Runtime model. The export and the optimized graph are written to
+    cache_dir on the first run; later runs load the optimized graph directly.
+    """
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForCausalLM
+
+    export_dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+    optimized_file = "model_optimized.onnx"
+    optimized_path = os.path.join(export_dir, optimized_file)
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = torch.get_num_threads()
+
+    if os.path.exists(optimized_path):
+        # Graph is already optimized: skip re-running the optimizer
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        return ORTModelForCausalLM.from_pretrained(
+            export_dir, file_name=optimized_file, session_options=options
+        )
+
+    if not os.path.exists(os.path.join(export_dir, "model.onnx")):
+        exported = ORTModelForCausalLM.from_pretrained(model_name, export=True)
+        exported.save_pretrained(export_dir)
+
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.optimized_model_filepath = optimized_path
+    return ORTModelForCausalLM.from_pretrained(export_dir, session_options=options)
+
+
+def load_generator(model_name: str, backend: str = "torch", cache_dir: str = None):
+    """Build a text-generation pipeline for model_name on the chosen backend."""
+    if backend not in GENERATOR_BACKENDS:
+        raise ValueError(
+            f"Unknown generator backend '{backend}'. "
+            f"Available: {list(GENERATOR_BACKENDS)}"
+        )
+
+    if backend == "torch":
+        model = load_torch_model(model_name)
+    elif backend == "int8":
+        model = load_int8_model(model_name)
+    else:
+        if cache_dir is None:
+            raise ValueError("The onnx backend needs a cache_dir for the exported graph")
+        model = load_onnx_model(model_name, cache_dir)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    return pipeline("text-generation", model=model, tokenizer=tokenizer)
+
+
+def supports_prefix_cache(backend: str) -> bool:
+    """ONNX Runtime manages its own KV tensors, so the shared prefix cache is torch-only."""
+    return backend in ("torch", "int8")
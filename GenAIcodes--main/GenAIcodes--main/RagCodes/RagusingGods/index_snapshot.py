@@ -0,0 +1,144 @@
+import json
+import os
+import time
+
+import numpy as np
+
+# -------------------------------------------------------------------
+# Portable, prebuilt index snapshot.
+#
+# build_index.py chunks and embeds the knowledge file offline and writes:
+#
+#   index_snapshot/
+#   ├─ manifest.json     (format, embedding model, corpus hash, chunker, shape)
+#   ├─ chunks.jsonl      (one {"id", "text", "metadata"} per row)
+#   └─ embeddings.npy    (float32, little-endian, one row per chunk)
+#
+# The app loads it (embeddings memory-mapped) instead of embedding at
+# startup. A snapshot is only used if its manifest matches the running
+# configuration; the manifest is written last, so a half-written snapshot
+# never matches.
+# -------------------------------------------------------------------
+
+SNAPSHOT_FORMAT = 1
+
+MANIFEST_NAME = "manifest.json"
+CHUNKS_NAME = "chunks.jsonl"
+EMBEDDINGS_NAME = "embeddings.npy"
+
+# Manifest fields that must equal the running configuration
+SNAPSHOT_KEYS = ("format", "model", "source_hash", "chunker")
+
+
+def open_embeddings(path: str, rows: int, dim: int) -> np.memmap:
+    """Create a (rows, dim) float32 .npy under path to fill batch by batch."""
+    os.makedirs(path, exist_ok=True)
+    return np.lib.format.open_memmap(
+        os.path.join(path, EMBEDDINGS_NAME + ".tmp"),
+        mode="w+",
+        dtype="<f4",
+        shape=(rows, dim),
+    )
+
+
+def write_snapshot(path: str, ids, chunks, metadatas, embeddings, key: dict) -> dict:
+    """
+    Write a snapshot to path and return its manifest.
+
+    :param ids:        Chunk ids, one per row.
+    :param chunks:     Chunk texts, one per row.
+    :param metadatas:  Chroma metadata dicts, one per row.
+    :param embeddings: (rows, dim) array, or the memmap from open_embeddings().
+    :param key:        model / source_hash / chunker this snapshot was built for.
+    """
+    os.makedirs(path, exist_ok=True)
+    if len(ids) != len(chunks) or len(ids) != len(metadatas) or len(ids) != len(embeddings):
+        raise ValueError(
+            f"Snapshot rows disagree: {len(ids)} ids, {len(chunks)} chunks, "
+            f"{len(metadatas)} metadatas, {len(embeddings)} embeddings."
+        )
+
+    # An older snapshot must not look valid while the new one is written
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    emb_tmp = os.path.join(path, EMBEDDINGS_NAME + ".tmp")
+    if isinstance(embeddings, np.memmap) and embeddings.filename == os.path.abspath(emb_tmp):
+        embeddings.flush()
+        shape = embeddings.shape
+    else:
+        arr = np.ascontiguousarray(embeddings, dtype="<f4")
+        with open(emb_tmp, "wb") as f:
+            np.save(f, arr)
+        shape = arr.shape
+    os.replace(emb_tmp, os.path.join(path, EMBEDDINGS_NAME))
+
+    chunks_tmp = os.path.join(path, CHUNKS_NAME + ".tmp")
+    with open(chunks_tmp, "w", encoding="utf-8") as f:
+        for cid, text, meta in zip(ids, chunks, metadatas):
+            f.write(json.dumps({"id": cid, "text": text, "metadata": meta}, ensure_ascii=False))
+            f.write("\n")
+    os.replace(chunks_tmp, os.path.join(path, CHUNKS_NAME))
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        **key,
+        "count": int(shape[0]),
+        "dim": int(shape[1]) if len(shape) > 1 else 0,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return manifest
+
+
+class IndexSnapshot:
+    """A loaded snapshot: ids, texts and metadata in memory, embeddings mmapped."""
+
+    def __init__(self, manifest, ids, chunks, metadatas, embeddings):
+        self.manifest = manifest
+        self.ids = ids
+        self.chunks = chunks
+        self.metadatas = metadatas
+        self.embeddings = embeddings
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, path: str, key: dict):
+        """
+        Load the snapshot at path if its manifest matches key; otherwise
+        (missing, different model/corpus/chunker, or inconsistent) return None.
+        """
+        manifest_path = os.path.join(path, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        expected = {"format": SNAPSHOT_FORMAT, **key}
+        if any(manifest.get(k) != expected.get(k) for k in SNAPSHOT_KEYS):
+            return None
+
+        try:
+            embeddings = np.load(os.path.join(path, EMBEDDINGS_NAME), mmap_mode="r")
+            ids, chunks, metadatas = [], [], []
+            with open(os.path.join(path, CHUNKS_NAME), "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        ids.append(row["id"])
+                        chunks.append(row["text"])
+                        metadatas.append(row.get("metadata") or {})
+        except (OSError, ValueError, KeyError):
+            return None
+
+        if embeddings.ndim != 2 or not (len(ids) == embeddings.shape[0] == manifest.get("count")):
+            return None
+        return cls(manifest, ids, chunks, metadatas, embeddings)
@@ -0,0 +1,69 @@
+import numpy as np
+
+# -------------------------------------------------------------------
+# Maximal Marginal Relevance selection.
+#
+# Picks k candidates that are relevant to the query but not redundant with
+# each other:  score = lambda * sim(query, c) - (1 - lambda) * max sim(c, picked)
+# All similarities come from one matrix product; the greedy loop runs k
+# times and updates "max similarity to what is picked" as a vector.
+# -------------------------------------------------------------------
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def mmr_select(
+    query_embedding,
+    candidate_embeddings,
+    k: int,
+    lambda_mult: float = 0.5,
+    redundancy_cutoff: float = None,
+):
+    """
+    Return indices of the selected candidates, in selection order.
+
+    :param query_embedding:      (dim,) query vector.
+    :param candidate_embeddings: (n, dim) candidate vectors.
+    :param k:                    Max number of candidates to select.
+    :param lambda_mult:          1.0 = pure relevance, 0.0 = pure diversity.
+    :param redundancy_cutoff:    If set, candidates at least this cosine-similar
+                                 to an already selected one are skipped (they
+                                 would only repeat content), so fewer than k
+                                 may be returned.
+    """
+    cands = np.asarray(candidate_embeddings, dtype=np.float32)
+    if cands.ndim != 2 or cands.shape[0] == 0:
+        return []
+
+    cands = _normalize(cands)
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32).ravel())
+
+    relevance = cands @ query       # (n,)
+    pairwise = cands @ cands.T      # (n, n)
+
+    n = cands.shape[0]
+    k = min(k, n)
+    selected = []
+    max_sim = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+
+    for step in range(k):
+        if step == 0:
+            scores = relevance.copy()
+        else:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * max_sim
+            if redundancy_cutoff is not None:
+                available &= max_sim < redundancy_cutoff
+        if not available.any():
+            break
+        scores[~available] = -np.inf
+
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        max_sim = np.maximum(max_sim, pairwise[:, best])
+
+    return selected
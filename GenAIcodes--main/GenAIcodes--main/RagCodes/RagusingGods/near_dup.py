@@ -0,0 +1,122 @@
+import re
+import zlib
+
+import numpy as np
+
+# -------------------------------------------------------------------
+# MinHash + LSH near-duplicate detection for ingestion.
+#
+# Each chunk gets a MinHash signature over its word shingles. Signatures are
+# split into LSH bands; chunks sharing a band bucket are candidates, and a
+# candidate whose estimated Jaccard similarity reaches the threshold is
+# treated as a near-duplicate of the first chunk seen (the representative).
+# -------------------------------------------------------------------
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Mersenne prime for the (a * x + b) mod p hash family. a * x may wrap around
+# in uint64 before the modulo; that still mixes well enough for MinHash.
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingles(text: str, size: int = 3):
+    """Set of word n-grams (the whole text if it is shorter than size words)."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def choose_bands(num_perm: int, threshold: float):
+    """
+    Pick (bands, rows) with bands * rows == num_perm so the LSH S-curve
+    threshold (1/bands)^(1/rows) sits just below the Jaccard threshold:
+    candidates are verified afterwards, so leaning towards recall is cheap.
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        lsh_threshold = (1.0 / bands) ** (1.0 / rows)
+        if lsh_threshold > threshold:
+            continue
+        if best is None or lsh_threshold > best[2]:
+            best = (bands, rows, lsh_threshold)
+    if best is None:
+        return num_perm, 1
+    return best[0], best[1]
+
+
+class NearDuplicateFilter:
+    """Streaming near-duplicate detector: call check() once per chunk, in order."""
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        shingle_size: int = 3,
+        seed: int = 1,
+    ):
+        """
+        :param threshold:    Min estimated Jaccard similarity to call it a duplicate.
+        :param num_perm:     MinHash signature length.
+        :param shingle_size: Words per shingle.
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+
+        # band index -> {band bytes -> [representative ids]}
+        self._buckets = [dict() for _ in range(self.bands)]
+        self._signatures = {}  # representative id -> signature
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature (uint32, num_perm values) of the text's shingles."""
+        grams = shingles(text, self.shingle_size)
+        if not grams:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+
+        x = np.fromiter(
+            (zlib.crc32(g.encode("utf-8")) for g in grams),
+            dtype=np.uint64,
+            count=len(grams),
+        )
+        # (num_perm, num_shingles) hash table, reduced to one min per permutation
+        hashed = (self._a[:, None] * x[None, :] + self._b[:, None]) % _PRIME
+        return (hashed.min(axis=1) & _MAX_HASH).astype(np.uint32)
+
+    def _band_keys(self, sig: np.ndarray):
+        for band in range(self.bands):
+            yield band, sig[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def check(self, chunk_id: str, text: str):
+        """
+        Return the representative id if text is a near-duplicate of an earlier
+        chunk; otherwise register chunk_id as a new representative and return None.
+        """
+        sig = self.signature(text)
+
+        candidates = set()
+        keys = list(self._band_keys(sig))
+        for band, key in keys:
+            candidates.update(self._buckets[band].get(key, ()))
+
+        best_id, best_sim = None, 0.0
+        for cand in candidates:
+            sim = float(np.mean(self._signatures[cand] == sig))
+            if sim > best_sim:
+                best_id, best_sim = cand, sim
+        if best_id is not None and best_sim >= self.threshold:
+            return best_id
+
+        self._signatures[chunk_id] = sig
+        for band, key in keys:
+            self._buckets[band].setdefault(key, []).append(chunk_id)
+        return None
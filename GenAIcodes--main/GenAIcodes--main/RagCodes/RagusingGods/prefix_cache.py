@@ -0,0 +1,58 @@
+import copy
+
+import torch
+
+# -------------------------------------------------------------------
+# KV-cache reuse for the constant start of every prompt.
+#
+# The strict instruction block is identical for every request, so its
+# past_key_values are computed once. Each request gets a copy of that cache
+# (generation appends to it) and the model only prefills the suffix:
+# context chunks, history and the question.
+#
+# The prompt is always tokenized as a whole, exactly as generate() would
+# see it, and the cache is only used when its token ids are a prefix of
+# that tokenization. BPE can merge across the prefix/suffix boundary
+# (GPT-2 has a single "\n\n" token), so the last prefix token is left out
+# of the cache and prefilled with the suffix.
+# -------------------------------------------------------------------
+
+
+class PrefixCache:
+    """Precomputed past_key_values for a fixed prompt prefix."""
+
+    def __init__(self, model, tokenizer, prefix: str):
+        self.prefix = prefix
+        prefix_ids = tokenizer(prefix, return_tensors="pt")["input_ids"]
+        # Drop the last token: it may merge with the first suffix characters
+        self.prefix_ids = prefix_ids[:, :-1] if prefix_ids.shape[-1] > 1 else prefix_ids
+
+        with torch.no_grad():
+            outputs = model(self.prefix_ids.to(model.device), use_cache=True)
+        self.past_key_values = outputs.past_key_values
+
+    @property
+    def prefix_len(self) -> int:
+        return self.prefix_ids.shape[-1]
+
+    def build_inputs(self, tokenizer, prompt: str):
+        """
+        Tokenize prompt for generate() and return (inputs, past_key_values).
+
+        inputs are always the plain tokenization of the whole prompt, so the
+        model sees the same ids as without the cache. past_key_values is a
+        copy of the cache when its ids match the start of those ids (and at
+        least one token is left to prefill), else None (no reuse).
+        """
+        inputs = dict(tokenizer(prompt, return_tensors="pt"))
+        input_ids = inputs["input_ids"]
+        n = self.prefix_len
+        if (
+            not prompt.startswith(self.prefix)
+            or input_ids.shape[-1] <= n
+            or not torch.equal(input_ids[:, :n], self.prefix_ids)
+        ):
+            return inputs, None
+
+        # generate() extends the cache in place, so every request needs a copy
+        return inputs, copy.deepcopy(self.past_key_values)
@@ -0,0 +1,123 @@
+import threading
+from collections import OrderedDict
+
+# -------------------------------------------------------------------
+# Token budgeting for the chat prompt.
+#
+# The instructions, retrieved chunks and the new question are always kept.
+# Whatever is left of the model's context window (minus room for the answer)
+# is filled with the most recent turns, newest first. Turns that no longer
+# fit are folded into a short running summary that is extended
+# incrementally, so each new turn only costs work for the new message.
+# -------------------------------------------------------------------
+
+# Strict instructions: always the first part of every prompt. Being constant,
+# their KV-cache is computed once (see prefix_cache.py).
+INSTRUCTIONS = (
+    "You are a question-answering assistant.\n"
+    "You MUST answer ONLY using the context below about Lord Dakshinamurthy and Maha Vishnu.\n"
+    "If the answer is not clearly present in the context, reply exactly with:\n"
+    "\"I don't know from this text.\"\n"
+    "\n"
+    "Context:\n"
+)
+
+# distilgpt2 has a 1024-token context window
+DEFAULT_CONTEXT_TOKENS = 1024
+
+# Each folded turn contributes at most this many characters to the summary
+SUMMARY_SNIPPET_CHARS = 120
+
+
+class TokenCounter:
+    """Memoized token counts for prompt lines (shared across sessions)."""
+
+    def __init__(self, tokenizer, max_entries: int = 4096):
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        with self._lock:
+            if text in self._cache:
+                self._cache.move_to_end(text)
+                return self._cache[text]
+
+        n = len(self.tokenizer.encode(text, add_special_tokens=False))
+
+        with self._lock:
+            self._cache[text] = n
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return n
+
+
+def format_turn(msg) -> str:
+    """One history message as a prompt line."""
+    speaker = "User" if msg["role"] == "user" else "Bot"
+    return f"{speaker}: {msg['text']}\n"
+
+
+def _snippet(text: str) -> str:
+    """First sentence of a message, capped to SUMMARY_SNIPPET_CHARS."""
+    text = " ".join(text.split())
+    for end in (". ", "? ", "! "):
+        pos = text.find(end)
+        if 0 <= pos < SUMMARY_SNIPPET_CHARS:
+            return text[: pos + 1]
+    if len(text) > SUMMARY_SNIPPET_CHARS:
+        return text[:SUMMARY_SNIPPET_CHARS].rsplit(" ", 1)[0] + "…"
+    return text
+
+
+def new_summary_state() -> dict:
+    """Per-session running summary: snippet lines + how many turns are folded."""
+    return {"folded": 0, "lines": []}
+
+
+def fold_into_summary(summary_state: dict, history, upto: int) -> None:
+    """Fold history[folded:upto] into the summary (only the new turns are touched)."""
+    for msg in history[summary_state["folded"]:upto]:
+        speaker = "User asked" if msg["role"] == "user" else "Bot said"
+        summary_state["lines"].append(f"{speaker}: {_snippet(msg['text'])}")
+    summary_state["folded"] = max(summary_state["folded"], upto)
+
+
+def fit_summary(summary_state: dict, counter: TokenCounter, budget: int) -> str:
+    """
+    Render the running summary within budget tokens, dropping its oldest
+    lines first. Returns "" if nothing fits.
+    """
+    if budget <= 0 or not summary_state["lines"]:
+        return ""
+
+    header = "Summary of earlier conversation:\n"
+    used = counter.count(header)
+    kept = []
+    for line in reversed(summary_state["lines"]):
+        cost = counter.count(line + "\n") + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+
+    if not kept:
+        return ""
+    return header + "\n".join(reversed(kept)) + "\n"
+
+
+def select_history(history, counter: TokenCounter, budget: int) -> int:
+    """
+    Return the index of the first message that fits in budget tokens when
+    taking messages newest first. history[start:] is kept verbatim.
+    """
+    used = 0
+    start = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        cost = counter.count(format_turn(history[i])) + 1
+        if used + cost > budget:
+            break
+        used += cost
+        start = i
+    return start
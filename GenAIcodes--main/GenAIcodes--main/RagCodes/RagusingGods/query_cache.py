@@ -0,0 +1,153 @@
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# -------------------------------------------------------------------
+# Two-level cache in front of retrieve_context():
+#
+#   1. exact:    LRU keyed on the normalized query text (no embedding needed)
+#   2. semantic: reuse results when the query embedding is within a cosine
+#                threshold of a cached query embedding
+#
+# Both levels are tied to a collection version. When ingestion changes the
+# index, set_version() drops everything cached for the old version.
+# -------------------------------------------------------------------
+
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return _SPACES_RE.sub(" ", query.strip().lower()).rstrip(" ?!.")
+
+
+class QueryCache:
+    """Thread-safe exact + semantic cache for retrieval results."""
+
+    def __init__(self, max_entries: int = 256, similarity_threshold: float = 0.95):
+        """
+        :param max_entries:          Max entries kept in EACH level (LRU eviction).
+        :param similarity_threshold: Min cosine similarity for a semantic hit.
+        """
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.version = 0
+
+        self._lock = threading.Lock()
+        self._exact = OrderedDict()  # (norm_query, params) -> result
+
+        # Semantic level: row i of _sem_matrix belongs to _sem_entries[i]
+        self._sem_entries = []  # [(params, result)]
+        self._sem_matrix = None  # float32 (n, dim), rows L2-normalized
+
+        self.stats = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+        }
+
+    # -----------------------------
+    # Versioning
+    # -----------------------------
+
+    def set_version(self, version: int) -> None:
+        """Record the collection version; a new version clears both levels."""
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            self._clear_locked()
+            self.stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        """Drop all cached results (the version stays the same)."""
+        with self._lock:
+            self._clear_locked()
+
+    def _clear_locked(self) -> None:
+        self._exact.clear()
+        self._sem_entries = []
+        self._sem_matrix = None
+
+    # -----------------------------
+    # Level 1: exact
+    # -----------------------------
+
+    def get_exact(self, query: str, params):
+        """
+        Return the cached result for this query, or None.
+
+        params is anything else that changes the result (top_k, re-ranking...);
+        it must be hashable and is matched exactly at both levels.
+        """
+        key = (normalize_query(query), params)
+        with self._lock:
+            if key in self._exact:
+                self._exact.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return self._exact[key]
+        return None
+
+    # -----------------------------
+    # Level 2: semantic
+    # -----------------------------
+
+    def get_semantic(self, embedding, params):
+        """Return a cached result for a near-identical query embedding, or None."""
+        vec = _unit(embedding)
+        with self._lock:
+            if self._sem_matrix is not None:
+                sims = self._sem_matrix @ vec
+                for row in np.argsort(-sims):
+                    if sims[row] < self.similarity_threshold:
+                        break
+                    cached_params, result = self._sem_entries[row]
+                    if cached_params == params:
+                        self.stats["semantic_hits"] += 1
+                        return result
+            self.stats["misses"] += 1
+        return None
+
+    # -----------------------------
+    # Store
+    # -----------------------------
+
+    def put(self, query: str, params, embedding, result, version: int) -> None:
+        """Store a fresh result in both levels (ignored if the version moved on)."""
+        vec = _unit(embedding)
+        key = (normalize_query(query), params)
+        with self._lock:
+            if version != self.version:
+                return
+
+            self._exact[key] = result
+            self._exact.move_to_end(key)
+            while len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+
+            self._sem_entries.append((params, result))
+            if self._sem_matrix is None:
+                self._sem_matrix = vec[None, :]
+            else:
+                self._sem_matrix = np.vstack([self._sem_matrix, vec])
+            if len(self._sem_entries) > self.max_entries:
+                self._sem_entries.pop(0)
+                self._sem_matrix = self._sem_matrix[1:]
+
+    def snapshot_stats(self) -> dict:
+        """Counters plus current sizes, for display."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["exact_entries"] = len(self._exact)
+            stats["semantic_entries"] = len(self._sem_entries)
+            stats["version"] = self.version
+        return stats
+
+
+def _unit(embedding) -> np.ndarray:
+    vec = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
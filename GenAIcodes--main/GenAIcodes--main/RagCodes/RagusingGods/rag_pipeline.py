@@ -0,0 +1,947 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import chromadb
+import numpy as np
+from chromadb.utils import embedding_functions
+
+from bm25 import BM25Index, reciprocal_rank_fusion
+from chunking import (
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_OVERLAP_TOKENS,
+    iter_chunks,
+    load_embed_tokenizer,
+)
+from context_compression import compress_chunks, context_line
+from index_snapshot import IndexSnapshot
+from generation_worker import STOP_MARKERS, BatchingGenerator
+from generator_backends import load_generator, supports_prefix_cache
+from prefix_cache import PrefixCache
+from prompt_budget import (
+    DEFAULT_CONTEXT_TOKENS,
+    INSTRUCTIONS,
+    TokenCounter,
+    fit_summary,
+    fold_into_summary,
+    format_turn,
+    new_summary_state,
+    select_history,
+)
+from query_cache import QueryCache
+from reranker import DEFAULT_CROSS_ENCODER, CrossEncoderReranker
+from retrievers import RETRIEVER_BACKENDS, ChromaRetriever, FaissRetriever
+from mmr import mmr_select
+from near_dup import NearDuplicateFilter
+from tracing import TraceRecorder, span, start_metrics_server
+
+# -------------------------------------------------------------------
+# Headless RAG pipeline: ingestion, retrieval, prompt building and
+# generation, with no Streamlit dependency. app.py is the UI on top of it;
+# benchmark_rag.py replays questions through it in batch.
+# -------------------------------------------------------------------
+
+
+# -------------------------------------------------------------------
+# 1. Process-wide resources
+# -------------------------------------------------------------------
+def resource(fn):
+    """
+    Build fn() once per process and share the result between threads (the
+    headless stand-in for st.cache_resource: Streamlit re-runs app.py but
+    keeps imported modules, so these live across reruns and sessions).
+    """
+    lock = threading.Lock()
+    holder = []
+
+    @functools.wraps(fn)
+    def wrapper():
+        if not holder:
+            with lock:
+                if not holder:
+                    holder.append(fn())
+        return holder[0]
+
+    return wrapper
+
+
+# -------------------------------------------------------------------
+# 2. Paths and constants
+# -------------------------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+KNOWLEDGE_FILE = os.path.join(DATA_DIR, "deities_knowledge.txt")
+
+CHROMA_DIR = os.path.join(BASE_DIR, "chroma_db")
+COLLECTION_NAME = "deities_rag_collection2"
+
+# Manifest of what is currently ingested (stored next to the Chroma data)
+MANIFEST_FILE = os.path.join(CHROMA_DIR, "ingest_manifest.json")
+
+# Dense retriever: "chroma" (default) or "faiss" (in-process HNSW index
+# saved in FAISS_DIR, built from the snapshot below when there is one)
+RETRIEVER_BACKEND = os.environ.get("RAG_RETRIEVER_BACKEND", "chroma")
+FAISS_DIR = os.path.join(BASE_DIR, "faiss_index")
+FAISS_HNSW_M = 32
+FAISS_EF_CONSTRUCTION = 40
+FAISS_EF_SEARCH = 50
+
+# Prebuilt chunks + embeddings written by build_index.py; used instead of
+# embedding at startup when its manifest matches (see sync_collection)
+SNAPSHOT_DIR = os.path.join(BASE_DIR, "index_snapshot")
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Query cache: entries per level and cosine threshold for a semantic hit
+QUERY_CACHE_SIZE = 256
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+# Hybrid retrieval: candidates taken from each retriever = top_k * this,
+# then merged with reciprocal rank fusion (RRF_K is the usual constant 60)
+HYBRID_CANDIDATE_FACTOR = 3
+RRF_K = 60
+
+# Optional cross-encoder re-ranking: over-fetch RERANK_CANDIDATES fused
+# chunks, score them in one batched call, keep the best top_k
+RERANK_ENABLED = False
+RERANK_MODEL_NAME = DEFAULT_CROSS_ENCODER
+RERANK_CANDIDATES = 30
+RERANK_BATCH_SIZE = 32
+
+# Optional MMR diversification: pick top_k out of top_k * MMR_POOL_FACTOR
+# candidates, trading relevance (lambda = 1) against redundancy (lambda = 0).
+# Candidates near-identical to a picked chunk are skipped entirely, so fewer
+# (non-redundant) context tokens reach the prompt.
+MMR_LAMBDA = None  # e.g. 0.5 to turn it on by default (mmr_lambda=False still turns it off)
+MMR_POOL_FACTOR = 4
+MMR_REDUNDANCY_CUTOFF = 0.95
+
+# Extractive compression: keep only the most query-relevant sentences of the
+# retrieved chunks, up to this many prompt tokens
+CONTEXT_TOKEN_BUDGET = 160
+
+# Generator: distilgpt2 on one of generator_backends.GENERATOR_BACKENDS
+# ("torch" fp32, "int8" dynamic quantization, "onnx" ONNX Runtime)
+GENERATOR_MODEL_NAME = "distilgpt2"
+GENERATOR_BACKEND = os.environ.get("RAG_GENERATOR_BACKEND", "torch")
+ONNX_CACHE_DIR = os.path.join(BASE_DIR, "onnx_cache")
+
+# Instrumentation: per-question traces go to a JSONL file, aggregated stage
+# timings are served as Prometheus text on RAG_METRICS_PORT (0 = off)
+TRACE_FILE = os.path.join(BASE_DIR, "traces", "rag_traces.jsonl")
+METRICS_PORT = int(os.environ.get("RAG_METRICS_PORT", "9464"))
+
+
+# -------------------------------------------------------------------
+# 3. Utilities: streaming chunker (see chunking.py)
+# -------------------------------------------------------------------
+# Chunks are sent to Chroma in batches of this size while streaming the file
+INGEST_BATCH_SIZE = 256
+
+# Near-duplicate chunks (MinHash estimated Jaccard >= this) are dropped at
+# ingestion; None turns the check off
+NEAR_DUP_THRESHOLD = 0.8
+
+# Recorded in the manifest: changing chunking settings forces a re-diff
+CHUNKER_SETTINGS = (
+    f"tokens:{DEFAULT_MAX_TOKENS}/overlap:{DEFAULT_OVERLAP_TOKENS}"
+    f"/near_dup:{NEAR_DUP_THRESHOLD}"
+)
+
+
+@resource
+def get_chunk_tokenizer():
+    """Tokenizer of the embedding model, used to size chunks in tokens."""
+    return load_embed_tokenizer()
+
+
+# -------------------------------------------------------------------
+# 4. Incremental ingestion: content-hashed ids + manifest
+# -------------------------------------------------------------------
+def file_sha256(path: str) -> str:
+    """Hash the knowledge file in blocks so we can skip re-chunking when unchanged."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(chunk: str) -> str:
+    """Stable id for a chunk: same text always gives the same id."""
+    return "chunk-" + hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:24]
+
+
+def chunk_set_hash(ids) -> str:
+    """
+    Hash of the set of chunk ids. Ids are content hashes, so this changes
+    with the indexed content, unlike the version counter, which restarts
+    when the manifest is lost.
+    """
+    digest = hashlib.sha256()
+    for cid in sorted(ids):
+        digest.update(cid.encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+
+def load_manifest(path: str = MANIFEST_FILE) -> dict:
+    """Read the ingest manifest, or return an empty one if it does not exist yet."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        # A broken manifest only costs us a full diff against the collection
+        return {}
+
+
+def save_manifest(manifest: dict, path: str = MANIFEST_FILE) -> None:
+    """Write the manifest atomically (temp file + rename)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def snapshot_key(source_hash: str) -> dict:
+    """What an index snapshot must have been built with to be reused."""
+    return {
+        "model": EMBEDDING_MODEL_NAME,
+        "source_hash": source_hash,
+        "chunker": CHUNKER_SETTINGS,
+    }
+
+
+def chunk_metadata(source: str, duplicates) -> dict:
+    """Chroma metadata of a stored chunk and the near-duplicates folded into it."""
+    return {
+        "source": source,
+        "near_duplicates": ",".join(duplicates),
+        "near_duplicate_count": len(duplicates),
+    }
+
+
+def iter_ingest_chunks(knowledge_path: str, dropped: dict):
+    """
+    Yield (chunk id, text) for every chunk that should be stored, in file order.
+
+    Exact repeats are skipped; near-duplicates (see NEAR_DUP_THRESHOLD) are
+    skipped too and recorded in dropped as {representative id: [ids]}.
+    """
+    seen = set()
+    near_dup = NearDuplicateFilter(NEAR_DUP_THRESHOLD) if NEAR_DUP_THRESHOLD else None
+    for chunk in iter_chunks(knowledge_path, tokenizer=get_chunk_tokenizer()):
+        cid = chunk_id(chunk)
+        if cid in seen:
+            continue
+        if near_dup is not None:
+            representative = near_dup.check(cid, chunk)
+            if representative is not None:
+                dropped.setdefault(representative, []).append(cid)
+                continue
+        seen.add(cid)
+        yield cid, chunk
+
+
+def sync_collection(collection, knowledge_path: str = KNOWLEDGE_FILE) -> dict:
+    """
+    Bring the collection in line with the knowledge file, touching only what changed.
+
+    - If the file hash matches the manifest, nothing is chunked or embedded.
+    - Otherwise, if SNAPSHOT_DIR holds a snapshot built from the same file,
+      model and chunker settings, its chunks and precomputed embeddings are
+      used (nothing is embedded here).
+    - Otherwise new / changed chunks are upserted (embedded) and chunks that
+      are no longer in the file are deleted.
+    - Near-duplicates of an earlier chunk (see NEAR_DUP_THRESHOLD) are not
+      stored; their ids are listed in the kept chunk's "near_duplicates"
+      metadata.
+
+    Returns a small report: {"added": n, "deleted": n, "unchanged": n,
+    "near_duplicates": n, "version": n, "content_hash": str,
+    "snapshot": bool}. The version goes up by one whenever the index
+    changes; content_hash is chunk_set_hash() of the stored chunk ids.
+    """
+    manifest = load_manifest()
+    source_hash = file_sha256(knowledge_path)
+    version = manifest.get("version", 0)
+
+    if (
+        manifest.get("source_hash") == source_hash
+        and manifest.get("chunker") == CHUNKER_SETTINGS
+        and collection.count() == len(manifest.get("chunk_ids", []))
+    ):
+        return {
+            "added": 0,
+            "deleted": 0,
+            "unchanged": len(manifest["chunk_ids"]),
+            "near_duplicates": manifest.get("near_duplicates", 0),
+            "version": version,
+            "content_hash": manifest.get("content_hash") or chunk_set_hash(manifest["chunk_ids"]),
+            "snapshot": False,
+        }
+
+    # What is actually stored wins over the manifest (covers old "chunk-0" ids too)
+    stored = collection.get(include=["metadatas"])
+    existing_ids = set(stored["ids"])
+    stored_dups = {
+        cid: (meta or {}).get("near_duplicates", "")
+        for cid, meta in zip(stored["ids"], stored["metadatas"])
+    }
+    source = os.path.basename(knowledge_path)
+
+    dropped = {}  # representative id -> [near-duplicate ids]
+    snapshot = IndexSnapshot.load(SNAPSHOT_DIR, snapshot_key(source_hash))
+    if snapshot is not None:
+        # (id, text, row) from the snapshot; vectors are read from the mmap
+        entries = (
+            (cid, text, row)
+            for row, (cid, text) in enumerate(zip(snapshot.ids, snapshot.chunks))
+        )
+        for cid, meta in zip(snapshot.ids, snapshot.metadatas):
+            if meta.get("near_duplicates"):
+                dropped[cid] = meta["near_duplicates"].split(",")
+    else:
+        entries = (
+            (cid, text, None) for cid, text in iter_ingest_chunks(knowledge_path, dropped)
+        )
+
+    # Stream chunks; only ids (and snapshot rows) are kept in memory
+    seen_ids = []
+    seen_set = set()
+    pending_docs, pending_ids, pending_rows = [], [], []
+    added = 0
+
+    def flush():
+        nonlocal added
+        if pending_ids:
+            extra = {}
+            if snapshot is not None:
+                extra["embeddings"] = np.asarray(snapshot.embeddings[pending_rows])
+            collection.upsert(
+                documents=pending_docs,
+                ids=pending_ids,
+                metadatas=[{"source": source} for _ in pending_ids],
+                **extra,
+            )
+            added += len(pending_ids)
+            pending_docs.clear()
+            pending_ids.clear()
+            pending_rows.clear()
+
+    for cid, chunk, row in entries:
+        seen_set.add(cid)
+        seen_ids.append(cid)
+        if cid not in existing_ids:
+            pending_docs.append(chunk)
+            pending_ids.append(cid)
+            pending_rows.append(row)
+            if len(pending_ids) >= INGEST_BATCH_SIZE:
+                flush()
+    flush()
+
+    stale_ids = [cid for cid in existing_ids if cid not in seen_set]
+    if stale_ids:
+        collection.delete(ids=stale_ids)
+
+    # Metadata-only update (no re-embedding) where the duplicate list changed
+    update_ids, update_metas = [], []
+    for cid in seen_ids:
+        dups = dropped.get(cid, [])
+        if ",".join(dups) != stored_dups.get(cid, ""):
+            update_ids.append(cid)
+            update_metas.append(chunk_metadata(source, dups))
+    for start in range(0, len(update_ids), INGEST_BATCH_SIZE):
+        collection.update(
+            ids=update_ids[start:start + INGEST_BATCH_SIZE],
+            metadatas=update_metas[start:start + INGEST_BATCH_SIZE],
+        )
+
+    num_dropped = sum(len(ids) for ids in dropped.values())
+    if added or stale_ids:
+        version += 1
+    content_hash = chunk_set_hash(seen_ids)
+
+    save_manifest(
+        {
+            "source": source,
+            "source_hash": source_hash,
+            "chunker": CHUNKER_SETTINGS,
+            "version": version,
+            "content_hash": content_hash,
+            "near_duplicates": num_dropped,
+            "chunk_ids": seen_ids,
+        }
+    )
+
+    return {
+        "added": added,
+        "deleted": len(stale_ids),
+        "unchanged": len(seen_ids) - added,
+        "near_duplicates": num_dropped,
+        "version": version,
+        "content_hash": content_hash,
+        "snapshot": snapshot is not None,
+    }
+
+
+def sync_bm25_index(
+    retriever,
+    version: int,
+    content_hash: str,
+    directory: str = CHROMA_DIR,
+) -> BM25Index:
+    """
+    Make sure the BM25 index stored in directory matches the dense index
+    version and content (chunk_set_hash of its ids); rebuild it from the
+    retriever's chunks if not. Checking the content hash as well keeps a
+    stale index from loading when a reset manifest repeats a version.
+    """
+    index = BM25Index.load(directory)
+    if index is not None and index.version == version and index.content_hash == content_hash:
+        return index
+
+    ids, documents = retriever.all_documents()
+    index = BM25Index.build(ids, documents, version=version, content_hash=content_hash)
+    index.save(directory)
+    return index
+
+
+# -------------------------------------------------------------------
+# 4b. Cache: embedding model + Chroma collection (PersistentClient)
+# -------------------------------------------------------------------
+@resource
+def get_embedding_fn():
+    """SentenceTransformer embedding function, shared by Chroma and the query cache."""
+    return embedding_functions.SentenceTransformerEmbeddingFunction(
+        model_name=EMBEDDING_MODEL_NAME
+    )
+
+
+@resource
+def get_query_cache():
+    """Exact + semantic cache for retrieve_context(), shared by all sessions."""
+    return QueryCache(
+        max_entries=QUERY_CACHE_SIZE,
+        similarity_threshold=SEMANTIC_CACHE_THRESHOLD,
+    )
+
+
+@resource
+def get_chroma_collection():
+    """
+    Create / load a ChromaDB collection and sync it with
+    deities_knowledge.txt (Dakshinamurthy & Maha Vishnu).
+
+    Uses the NEW Chroma persistent client API. Only chunks that changed
+    since the last run are embedded, and none at all when a matching
+    snapshot from build_index.py exists (see sync_collection).
+    """
+    # SentenceTransformer embedding function used by Chroma
+    embedding_fn = get_embedding_fn()
+
+    # NEW: use PersistentClient for local on-disk storage
+    client = chromadb.PersistentClient(path=CHROMA_DIR)
+
+    collection = client.get_or_create_collection(
+        name=COLLECTION_NAME,
+        embedding_function=embedding_fn,
+    )
+
+    # Diff the knowledge file against the manifest; embed only the changes
+    report = sync_collection(collection)
+
+    # Lexical index is part of ingestion and lives next to the Chroma data
+    sync_bm25_index(ChromaRetriever(collection), report["version"], report["content_hash"])
+
+    # Cached query results are only valid for this version of the index
+    get_query_cache().set_version(report["version"])
+
+    return collection
+
+
+@resource
+def get_faiss_retriever():
+    """
+    FAISS HNSW index over the current knowledge file, loaded from FAISS_DIR.
+
+    Rebuilt (and saved) when the file, embedding model or chunker settings
+    changed: from the index snapshot if it matches, otherwise by chunking and
+    embedding the file here. Chroma is not opened at all.
+    """
+    key = snapshot_key(file_sha256(KNOWLEDGE_FILE))
+    retriever = FaissRetriever.load(FAISS_DIR)
+    if retriever is None or any(retriever.meta.get(k) != v for k, v in key.items()):
+        version = retriever.version + 1 if retriever is not None else 1
+
+        snapshot = IndexSnapshot.load(SNAPSHOT_DIR, key)
+        if snapshot is not None:
+            ids, documents, embeddings = snapshot.ids, snapshot.chunks, snapshot.embeddings
+        else:
+            ids, documents = [], []
+            for cid, chunk in iter_ingest_chunks(KNOWLEDGE_FILE, {}):
+                ids.append(cid)
+                documents.append(chunk)
+            embed = get_embedding_fn()
+            embeddings = np.vstack(
+                [
+                    np.asarray(embed(documents[lo:lo + INGEST_BATCH_SIZE]), dtype=np.float32)
+                    for lo in range(0, len(documents), INGEST_BATCH_SIZE)
+                ]
+            )
+
+        retriever = FaissRetriever.build(
+            ids,
+            documents,
+            embeddings,
+            m=FAISS_HNSW_M,
+            ef_construction=FAISS_EF_CONSTRUCTION,
+            ef_search=FAISS_EF_SEARCH,
+            meta={**key, "version": version},
+        )
+        retriever.save(FAISS_DIR)
+
+    sync_bm25_index(retriever, retriever.version, chunk_set_hash(retriever.ids), FAISS_DIR)
+    get_query_cache().set_version(retriever.version)
+    return retriever
+
+
+@resource
+def get_retriever():
+    """The dense retriever selected by RETRIEVER_BACKEND."""
+    if RETRIEVER_BACKEND not in RETRIEVER_BACKENDS:
+        raise ValueError(
+            f"Unknown retriever backend '{RETRIEVER_BACKEND}'. "
+            f"Available: {list(RETRIEVER_BACKENDS)}"
+        )
+    if RETRIEVER_BACKEND == "faiss":
+        return get_faiss_retriever()
+    return ChromaRetriever(get_chroma_collection())
+
+
+@resource
+def get_bm25_index():
+    """BM25 index saved next to the dense index (loaded once per process)."""
+    retriever = get_retriever()
+    if retriever.name == "faiss":
+        directory, content_hash = FAISS_DIR, chunk_set_hash(retriever.ids)
+    else:
+        # get_chroma_collection() has just synced the manifest
+        directory, content_hash = CHROMA_DIR, load_manifest().get("content_hash")
+    return sync_bm25_index(retriever, get_query_cache().version, content_hash, directory)
+
+
+@resource
+def get_reranker():
+    """Cross-encoder used when retrieve_context(rerank=True)."""
+    return CrossEncoderReranker(RERANK_MODEL_NAME, batch_size=RERANK_BATCH_SIZE)
+
+
+@resource
+def get_retrieval_pool():
+    """Worker threads for running lexical search next to the dense query."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+
+
+# -------------------------------------------------------------------
+# 5. Cache: local text-generation model
+# -------------------------------------------------------------------
+@resource
+def load_model():
+    """
+    Load a smaller local text-generation model (distilgpt2) once and cache it,
+    on the backend chosen by GENERATOR_BACKEND.
+    """
+    generator = load_generator(
+        GENERATOR_MODEL_NAME,  # smaller & faster than DialoGPT-medium
+        backend=GENERATOR_BACKEND,
+        cache_dir=ONNX_CACHE_DIR,
+    )
+    return generator
+
+
+@resource
+def load_prefix_cache():
+    """
+    Precompute the KV-cache for the constant instruction block once, so each
+    request only has to prefill the variable part of the prompt.
+
+    Returns None for backends that cannot take a shared torch KV-cache.
+    """
+    if not supports_prefix_cache(GENERATOR_BACKEND):
+        return None
+    generator = load_model()
+    return PrefixCache(generator.model, generator.tokenizer, INSTRUCTIONS)
+
+
+@resource
+def get_trace_recorder():
+    """Trace sink shared by all sessions; also starts the /metrics endpoint."""
+    recorder = TraceRecorder(TRACE_FILE)
+    if METRICS_PORT:
+        try:
+            start_metrics_server(recorder, METRICS_PORT)
+        except OSError:
+            # Port taken (e.g. a second app instance): keep the JSONL trace only
+            pass
+    return recorder
+
+
+# -------------------------------------------------------------------
+# 6. RAG helper: hybrid (BM25 + dense) retrieval
+# -------------------------------------------------------------------
+def retrieve_context(
+    query: str,
+    top_k: int = 3,
+    rerank: bool = None,
+    mmr_lambda: float = None,
+    trace=None,
+    return_embedding: bool = False,
+):
+    """
+    Get the top_k relevant chunks for the given user query.
+
+    The query is embedded once; after both cache levels miss, the BM25 search
+    runs on a worker thread while the embedding is sent to the dense
+    retriever (ChromaDB or FAISS, see RETRIEVER_BACKEND); both rankings are
+    merged with reciprocal rank fusion.
+    With rerank=True (default: RERANK_ENABLED) the best RERANK_CANDIDATES
+    fused chunks are re-scored by a cross-encoder and the top_k kept.
+    With mmr_lambda set (default: MMR_LAMBDA) the final top_k are chosen by
+    Maximal Marginal Relevance over a larger pool, skipping redundant chunks;
+    mmr_lambda=False turns MMR off whatever MMR_LAMBDA is.
+
+    Results go through the query cache: an exact repeat skips embedding and
+    retrieval entirely, a near-identical question skips the searches.
+
+    If a tracing.Trace is given, each stage is recorded as a span and the
+    returned chunk ids are stored in trace.attrs["chunk_ids"].
+
+    With return_embedding=True the result is (documents, query_embedding),
+    so compress_context() can reuse the vector instead of embedding the
+    question again; query_embedding is None after an exact cache hit.
+    """
+    retriever = get_retriever()
+    bm25_index = get_bm25_index()
+    cache = get_query_cache()
+    version = cache.version
+
+    if rerank is None:
+        rerank = RERANK_ENABLED
+    if mmr_lambda is None:
+        mmr_lambda = MMR_LAMBDA
+    if mmr_lambda is False:   # not "== False": 0.0 is a valid lambda
+        mmr_lambda = None
+    use_mmr = mmr_lambda is not None
+    cache_params = (top_k, rerank, mmr_lambda)
+
+    with span(trace, "cache_exact"):
+        cached = cache.get_exact(query, cache_params)
+    if cached is not None:
+        _trace_chunks(trace, cached, "exact")
+        return (list(cached), None) if return_embedding else list(cached)
+
+    # How many chunks survive fusion (and re-ranking) before the final pick
+    pool_size = top_k * MMR_POOL_FACTOR if use_mmr else top_k
+
+    num_candidates = max(top_k * HYBRID_CANDIDATE_FACTOR, pool_size)
+    if rerank:
+        num_candidates = max(num_candidates, RERANK_CANDIDATES)
+
+    def lexical_search():
+        start = time.perf_counter()
+        hits = bm25_index.search(query, num_candidates)
+        if trace is not None:
+            trace.add_span("bm25_search", (time.perf_counter() - start) * 1000)
+        return hits
+
+    # Embed once and reuse the vector for both the semantic lookup and Chroma
+    with span(trace, "embed_query"):
+        query_embedding = get_embedding_fn()([query])[0]
+
+    with span(trace, "cache_semantic"):
+        cached = cache.get_semantic(query_embedding, cache_params)
+    if cached is not None:
+        _trace_chunks(trace, cached, "semantic")
+        return (list(cached), query_embedding) if return_embedding else list(cached)
+
+    # Only now, so a cache hit never leaves a BM25 search running on the pool
+    lexical_future = get_retrieval_pool().submit(lexical_search)
+
+    with span(trace, f"{retriever.name}_query", n_results=num_candidates):
+        result = retriever.search(query_embedding, num_candidates, include_embeddings=use_mmr)
+
+    dense_ids = result["ids"]
+    texts = dict(zip(dense_ids, result["documents"]))
+    vectors = {}
+    if use_mmr and result["embeddings"] is not None:
+        vectors = dict(zip(dense_ids, result["embeddings"]))
+
+    lexical_ids = [doc_id for doc_id, _ in lexical_future.result()]
+    with span(trace, "fuse"):
+        fused_ids = reciprocal_rank_fusion([dense_ids, lexical_ids], k=RRF_K)
+        fused_ids = fused_ids[: RERANK_CANDIDATES if rerank else pool_size]
+
+    # Chunks found only by BM25 still need their text (and vector, for MMR)
+    missing = [
+        doc_id
+        for doc_id in fused_ids
+        if doc_id not in texts or (use_mmr and doc_id not in vectors)
+    ]
+    if missing:
+        with span(trace, "fetch_missing", count=len(missing)):
+            fetched = retriever.fetch(missing, include_embeddings=use_mmr)
+        texts.update(zip(fetched["ids"], fetched["documents"]))
+        if use_mmr:
+            vectors.update(zip(fetched["ids"], fetched["embeddings"]))
+
+    fused_ids = [doc_id for doc_id in fused_ids if doc_id in texts]
+    if rerank:
+        with span(trace, "rerank", candidates=len(fused_ids)):
+            ranked = get_reranker().rerank(
+                query, fused_ids, [texts[doc_id] for doc_id in fused_ids], pool_size
+            )
+        fused_ids = [doc_id for doc_id, _ in ranked]
+
+    if use_mmr:
+        fused_ids = [doc_id for doc_id in fused_ids if doc_id in vectors]
+        with span(trace, "mmr", candidates=len(fused_ids)):
+            picked = mmr_select(
+                query_embedding,
+                [vectors[doc_id] for doc_id in fused_ids],
+                k=top_k,
+                lambda_mult=mmr_lambda,
+                redundancy_cutoff=MMR_REDUNDANCY_CUTOFF,
+            )
+        fused_ids = [fused_ids[i] for i in picked]
+
+    documents = [texts[doc_id] for doc_id in fused_ids]
+
+    cache.put(query, cache_params, query_embedding, tuple(documents), version)
+    if trace is not None:
+        trace.set("chunk_ids", fused_ids)
+        trace.set("cache", "miss")
+    return (documents, query_embedding) if return_embedding else documents
+
+
+def _trace_chunks(trace, documents, cache_level: str) -> None:
+    """Chunk ids for cached results (ids are content hashes, see chunk_id)."""
+    if trace is not None:
+        trace.set("chunk_ids", [chunk_id(doc) for doc in documents])
+        trace.set("cache", cache_level)
+
+
+def compress_context(query: str, documents, trace=None, query_embedding=None):
+    """
+    Shrink the retrieved chunks to their most query-relevant sentences.
+
+    Returns (texts, chunk_ids, stats): the compressed chunks to put in the
+    prompt, the id each one cites, and the context token counts before and
+    after (stats["tokens_saved"] is what this request no longer prefills).
+
+    Pass the query_embedding from retrieve_context(return_embedding=True)
+    to skip embedding the question a second time.
+    """
+    ids = [chunk_id(doc) for doc in documents]
+    with span(trace, "compress"):
+        texts, ids, stats = compress_chunks(
+            query,
+            ids,
+            documents,
+            get_embedding_fn(),
+            get_token_counter(),
+            CONTEXT_TOKEN_BUDGET,
+            query_embedding=query_embedding,
+        )
+    if trace is not None:
+        trace.set("cited_chunk_ids", ids)
+        trace.set("context_tokens_before", stats["tokens_before"])
+        trace.set("context_tokens_saved", stats["tokens_saved"])
+    return texts, ids, stats
+
+
+# -------------------------------------------------------------------
+# 7. Prompt construction (strict RAG, token-budgeted history)
+# -------------------------------------------------------------------
+# Tokens kept for the summary of older turns once history overflows
+SUMMARY_RESERVE_TOKENS = 96
+
+
+@resource
+def get_token_counter():
+    """Memoized token counts for the generator's tokenizer."""
+    return TokenCounter(load_model().tokenizer)
+
+
+def build_prompt_from_history(
+    history, user_message, used_context, counter=None, summary_state=None
+):
+    """
+    Build a strict prompt that forces the model to use only RAG context.
+
+    Instructions, retrieved chunks and the question are always included.
+    With a TokenCounter, history is trimmed to what fits in the context
+    window (leaving room for MAX_NEW_TOKENS): recent turns are kept verbatim
+    and older ones are folded into summary_state's running summary.
+    The prompt always starts with INSTRUCTIONS (see load_prefix_cache).
+    """
+    lines = []
+
+    # Strict instructions
+    lines.append(INSTRUCTIONS)
+
+    # Add RAG context (chunks from ChromaDB)
+    for i, ctx in enumerate(used_context, start=1):
+        lines.append(context_line(i, ctx))
+
+    lines.append("\nConversation so far:\n")
+
+    # Latest user message + ask for bot answer
+    tail = [f"User: {user_message}\n", "Bot:"]
+
+    if counter is None:
+        start, summary = 0, ""
+    else:
+        fixed = sum(counter.count(line) + 1 for line in lines + tail)
+        budget = DEFAULT_CONTEXT_TOKENS - MAX_NEW_TOKENS - fixed
+
+        if summary_state is None:
+            summary_state = new_summary_state()
+
+        start = max(select_history(history, counter, budget), summary_state["folded"])
+        if start > 0:
+            # Some turns must go: make room for the summary, then fold them
+            start = max(
+                select_history(history, counter, budget - SUMMARY_RESERVE_TOKENS),
+                summary_state["folded"],
+            )
+            fold_into_summary(summary_state, history, start)
+
+        history_tokens = sum(counter.count(format_turn(m)) + 1 for m in history[start:])
+        summary = fit_summary(summary_state, counter, budget - history_tokens)
+
+    if summary:
+        lines.append(summary)
+
+    # Add previous chat history (most recent turns)
+    for msg in history[start:]:
+        lines.append(format_turn(msg))
+
+    lines.extend(tail)
+
+    return "\n".join(lines)
+
+
+# -------------------------------------------------------------------
+# 8. Generation with low creativity (less hallucination), streamed
+# -------------------------------------------------------------------
+MAX_NEW_TOKENS = 40
+FALLBACK_REPLY = "I don't know from this text."
+
+# Micro-batching: requests arriving within this many ms share one batch
+GENERATION_MAX_BATCH_SIZE = 8
+GENERATION_MAX_WAIT_MS = 5.0
+
+
+@resource
+def get_generation_worker():
+    """The single worker thread that owns the generator model."""
+    return BatchingGenerator(
+        load_model(),
+        max_batch_size=GENERATION_MAX_BATCH_SIZE,
+        max_wait_ms=GENERATION_MAX_WAIT_MS,
+        prefix_cache=load_prefix_cache(),
+    )
+
+
+def trim_at_stop_markers(text: str) -> str:
+    """
+    Cut text at the first stop marker, and hide a trailing partial marker
+    (e.g. "Us") so it never flashes up in the streamed answer.
+    """
+    for marker in STOP_MARKERS:
+        if marker in text:
+            text = text.split(marker)[0]
+    for marker in STOP_MARKERS:
+        for i in range(len(marker) - 1, 0, -1):
+            if text.endswith(marker[:i]):
+                text = text[: -i]
+                break
+    return text
+
+
+def generate_bot_reply(
+    history,
+    user_message,
+    used_context,
+    on_text=None,
+    metrics=None,
+    summary_state=None,
+    trace=None,
+):
+    """
+    Generate a reply using the strict RAG prompt and low creativity.
+
+    The prompt is queued to the shared generation worker, which may batch it
+    with other sessions' prompts; text is streamed back as it is produced.
+    on_text(partial_reply) is called for every new piece, and if a metrics
+    dict is given it is filled with ttft_s, num_tokens, tokens_per_s,
+    queue_wait_s and batch_size.
+    summary_state is the session's running summary of folded older turns.
+    With a tracing.Trace, prompt build, queue wait, time-to-first-token and
+    decoding are recorded as spans, plus prompt/generated token counts.
+    """
+    with span(trace, "prompt_build"):
+        prompt = build_prompt_from_history(
+            history,
+            user_message,
+            used_context,
+            counter=get_token_counter(),
+            summary_state=summary_state,
+        )
+
+    # Safer settings: deterministic (greedy in the worker) + shorter answers
+    handle = get_generation_worker().submit(prompt, max_new_tokens=MAX_NEW_TOKENS)
+
+    generated = ""
+    for piece in handle:
+        generated += piece
+        if on_text is not None:
+            on_text(trim_at_stop_markers(generated).strip())
+    stats = handle.result()
+
+    if trace is not None:
+        trace.add_span("queue_wait", stats["queue_wait_s"] * 1000)
+        trace.add_span("generate_ttft", stats["ttft_s"] * 1000)
+        trace.add_span("generate_decode", stats["decode_s"] * 1000)
+        trace.set("prompt_tokens", stats["prompt_tokens"])
+        trace.set("generated_tokens", stats["num_tokens"])
+        trace.set("batch_size", stats["batch_size"])
+
+    # Cut at any "User:" or "Bot:" marker the model generated before stopping
+    bot_part = generated
+    for stop_token in STOP_MARKERS:
+        if stop_token in bot_part:
+            bot_part = bot_part.split(stop_token)[0]
+    bot_part = bot_part.strip()
+
+    if len(bot_part) == 0:
+        bot_part = FALLBACK_REPLY
+
+    if metrics is not None:
+        decode_time = stats["decode_s"]
+        metrics["ttft_s"] = round(stats["ttft_s"], 3)
+        metrics["num_tokens"] = stats["num_tokens"]
+        metrics["tokens_per_s"] = (
+            round(stats["num_tokens"] / decode_time, 1) if decode_time > 0 else 0.0
+        )
+        metrics["queue_wait_s"] = round(stats["queue_wait_s"], 3)
+        metrics["batch_size"] = stats["batch_size"]
+
+    return bot_part
@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from query_cache import normalize_query
+
+# -------------------------------------------------------------------
+# Optional re-ranking stage for retrieved chunks.
+#
+# retrieve_context() over-fetches candidates (e.g. top-30); a small CPU
+# cross-encoder scores all (query, chunk) pairs in one batched call and the
+# best k are kept. Scores are cached per (query, chunk id), so repeated or
+# overlapping questions only score the chunks they have not seen yet.
+# -------------------------------------------------------------------
+
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """Batched cross-encoder scoring with a per-(query, chunk id) score cache."""
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_CROSS_ENCODER,
+        batch_size: int = 32,
+        max_cached_scores: int = 50_000,
+    ):
+        """
+        :param model_name:        sentence-transformers CrossEncoder model.
+        :param batch_size:        Pairs per forward pass inside the batched call.
+        :param max_cached_scores: LRU size of the (query, chunk id) score cache.
+        """
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.batch_size = batch_size
+        self.max_cached_scores = max_cached_scores
+
+        self._scores = OrderedDict()  # (norm_query, chunk_id) -> score
+        self._lock = threading.Lock()
+
+        # Timing of the most recent calls, newest last
+        self.timings = deque(maxlen=100)
+
+    def rerank(self, query: str, ids, texts, top_k: int):
+        """
+        Score candidates and return the best top_k as [(chunk_id, score)].
+
+        :param ids:   Candidate chunk ids (any order).
+        :param texts: Chunk texts, parallel to ids.
+        """
+        start = time.perf_counter()
+        norm_query = normalize_query(query)
+
+        scores = {}
+        to_score = []
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                key = (norm_query, chunk_id)
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    scores[chunk_id] = self._scores[key]
+                else:
+                    to_score.append((chunk_id, text))
+
+        if to_score:
+            predicted = self.model.predict(
+                [(query, text) for _, text in to_score],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            with self._lock:
+                for (chunk_id, _), score in zip(to_score, predicted):
+                    score = float(score)
+                    scores[chunk_id] = score
+                    self._scores[(norm_query, chunk_id)] = score
+                while len(self._scores) > self.max_cached_scores:
+                    self._scores.popitem(last=False)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+        timing = {
+            "candidates": len(scores),
+            "scored": len(to_score),
+            "cached": len(scores) - len(to_score),
+            "ms": (time.perf_counter() - start) * 1000,
+        }
+        self.timings.append(timing)
+        logger.info(
+            "rerank: %d candidates (%d scored, %d cached) in %.1f ms",
+            timing["candidates"],
+            timing["scored"],
+            timing["cached"],
+            timing["ms"],
+        )
+        return ranked
@@ -0,0 +1,214 @@
+import json
+import os
+
+import numpy as np
+
+# -------------------------------------------------------------------
+# Dense retriever backends behind one small interface.
+#
+#   chroma - the Chroma collection (SQLite + Chroma's own HNSW), default
+#   faiss  - in-process FAISS IndexHNSWFlat (as in vectordb/vectorindex.py)
+#            with a row -> chunk id map, saved next to the chunk texts
+#
+# retrieve_context() only calls search() and fetch(); the BM25 index is
+# built from all_documents(). Results are plain dicts of parallel lists:
+# {"ids": [...], "documents": [...], "embeddings": [...] or None}.
+# -------------------------------------------------------------------
+
+RETRIEVER_BACKENDS = ("chroma", "faiss")
+
+FAISS_INDEX_NAME = "hnsw.index"
+FAISS_DOCS_NAME = "docs.jsonl"
+FAISS_META_NAME = "faiss_meta.json"
+
+
+class Retriever:
+    """What retrieve_context() needs from a dense index."""
+
+    name = "base"
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def search(self, query_embedding, k: int, include_embeddings: bool = False) -> dict:
+        """The k nearest chunks to query_embedding, closest first."""
+        raise NotImplementedError
+
+    def fetch(self, ids, include_embeddings: bool = False) -> dict:
+        """Chunks by id (unknown ids are left out)."""
+        raise NotImplementedError
+
+    def all_documents(self):
+        """(ids, documents) of every stored chunk."""
+        raise NotImplementedError
+
+
+class ChromaRetriever(Retriever):
+    name = "chroma"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def search(self, query_embedding, k: int, include_embeddings: bool = False) -> dict:
+        result = self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=k,
+            include=["documents", "embeddings"] if include_embeddings else ["documents"],
+        )
+        # Chroma returns one list per query: [[...]]
+        embeddings = result.get("embeddings") if include_embeddings else None
+        return {
+            "ids": result["ids"][0] if result.get("ids") else [],
+            "documents": result["documents"][0] if result.get("documents") else [],
+            "embeddings": embeddings[0] if embeddings is not None else None,
+        }
+
+    def fetch(self, ids, include_embeddings: bool = False) -> dict:
+        result = self.collection.get(
+            ids=list(ids),
+            include=["documents", "embeddings"] if include_embeddings else ["documents"],
+        )
+        return {
+            "ids": result["ids"],
+            "documents": result["documents"],
+            "embeddings": result["embeddings"] if include_embeddings else None,
+        }
+
+    def all_documents(self):
+        stored = self.collection.get(include=["documents"])
+        return stored["ids"], stored["documents"]
+
+
+class FaissRetriever(Retriever):
+    """
+    FAISS HNSW index over the chunk embeddings (L2, like Chroma's default).
+
+    FAISS only knows row numbers, so ids[row] maps a hit back to its chunk
+    id and _rows maps a chunk id to its row for fetch().
+    """
+
+    name = "faiss"
+
+    def __init__(self, index, ids, documents, meta: dict):
+        self.index = index
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.meta = meta
+        self._rows = {cid: row for row, cid in enumerate(self.ids)}
+
+    @property
+    def version(self) -> int:
+        return self.meta.get("version", 0)
+
+    @classmethod
+    def build(
+        cls,
+        ids,
+        documents,
+        embeddings,
+        m: int = 32,
+        ef_construction: int = 40,
+        ef_search: int = 50,
+        meta: dict = None,
+    ):
+        """
+        Index the embeddings (one row per id) in a new IndexHNSWFlat.
+
+        :param m:               HNSW neighbours per node.
+        :param ef_construction: Candidate list size while building.
+        :param ef_search:       Candidate list size while searching.
+        :param meta:            Extra fields saved with the index (version, corpus key...).
+        """
+        import faiss
+
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(ids):
+            raise ValueError(
+                f"Expected {len(ids)} embeddings as a 2-D array, got shape {vectors.shape}."
+            )
+
+        index = faiss.IndexHNSWFlat(vectors.shape[1], m)
+        index.hnsw.efConstruction = ef_construction
+        index.hnsw.efSearch = ef_search
+        index.add(vectors)
+
+        meta = dict(meta or {})
+        meta.update(m=m, ef_construction=ef_construction, ef_search=ef_search)
+        return cls(index, ids, documents, meta)
+
+    def save(self, path: str) -> None:
+        """Write the index, the id map + texts and the meta (last) to path."""
+        import faiss
+
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, FAISS_META_NAME)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        faiss.write_index(self.index, os.path.join(path, FAISS_INDEX_NAME))
+        with open(os.path.join(path, FAISS_DOCS_NAME), "w", encoding="utf-8") as f:
+            for cid, text in zip(self.ids, self.documents):
+                f.write(json.dumps({"id": cid, "text": text}, ensure_ascii=False) + "\n")
+
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({**self.meta, "count": len(self.ids)}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    @classmethod
+    def load(cls, path: str):
+        """Load a saved index, or None if there is none (or it is incomplete)."""
+        import faiss
+
+        meta_path = os.path.join(path, FAISS_META_NAME)
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            index = faiss.read_index(os.path.join(path, FAISS_INDEX_NAME))
+            ids, documents = [], []
+            with open(os.path.join(path, FAISS_DOCS_NAME), "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        ids.append(row["id"])
+                        documents.append(row["text"])
+        except (OSError, RuntimeError, ValueError, KeyError):
+            return None
+
+        if index.ntotal != len(ids) or meta.get("count") != len(ids):
+            return None
+        index.hnsw.efSearch = meta.get("ef_search", index.hnsw.efSearch)
+        return cls(index, ids, documents, meta)
+
+    def count(self) -> int:
+        return self.index.ntotal
+
+    def _vectors(self, rows):
+        if not rows:
+            return []
+        return [self.index.reconstruct(int(row)) for row in rows]
+
+    def search(self, query_embedding, k: int, include_embeddings: bool = False) -> dict:
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
+        _, found = self.index.search(query, min(k, self.index.ntotal))
+        rows = [int(row) for row in found[0] if row >= 0]
+        return {
+            "ids": [self.ids[row] for row in rows],
+            "documents": [self.documents[row] for row in rows],
+            "embeddings": self._vectors(rows) if include_embeddings else None,
+        }
+
+    def fetch(self, ids, include_embeddings: bool = False) -> dict:
+        rows = [self._rows[cid] for cid in ids if cid in self._rows]
+        return {
+            "ids": [self.ids[row] for row in rows],
+            "documents": [self.documents[row] for row in rows],
+            "embeddings": self._vectors(rows) if include_embeddings else None,
+        }
+
+    def all_documents(self):
+        return list(self.ids), list(self.documents)
@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# -------------------------------------------------------------------
+# Lightweight per-stage instrumentation for the RAG pipeline.
+#
+# A Trace collects timing spans (embed query, Chroma query, prompt build,
+# generation...) plus attributes such as token counts and chunk ids for one
+# question. TraceRecorder appends finished traces to a JSONL file and keeps
+# Prometheus-style histograms that a tiny HTTP endpoint serves as text.
+# -------------------------------------------------------------------
+
+# Histogram buckets for stage durations, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Trace:
+    """Spans and attributes for one question."""
+
+    def __init__(self, question: str = ""):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self.question = question
+        self.spans = []  # [{"name", "ms", ...attrs}]
+        self.attrs = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Time the enclosed block as one stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, (time.perf_counter() - start) * 1000, **attrs)
+
+    def add_span(self, name: str, ms: float, **attrs) -> None:
+        """Record a stage timed elsewhere (e.g. on another thread)."""
+        with self._lock:
+            self.spans.append({"name": name, "ms": round(ms, 3), **attrs})
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            self.attrs[key] = value
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "ts": self.started_at,
+                "question": self.question,
+                "spans": list(self.spans),
+                "attrs": dict(self.attrs),
+            }
+
+
+def span(trace, name: str, **attrs):
+    """trace.span(...) if tracing is on, otherwise a no-op context manager."""
+    if trace is None:
+        return nullcontext()
+    return trace.span(name, **attrs)
+
+
+class TraceRecorder:
+    """Appends traces to a JSONL file and aggregates Prometheus metrics."""
+
+    def __init__(self, jsonl_path: str = None):
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+
+        # stage -> [bucket counts..., +Inf count], sum of seconds
+        self._buckets = {}
+        self._sums = {}
+        self._requests = 0
+        self._counters = {
+            "prompt_tokens": 0,
+            "generated_tokens": 0,
+            "context_tokens_saved": 0,
+        }
+
+        if jsonl_path:
+            os.makedirs(os.path.dirname(jsonl_path), exist_ok=True)
+
+    def record(self, trace: Trace) -> None:
+        data = trace.to_dict()
+        with self._lock:
+            self._requests += 1
+            for s in data["spans"]:
+                self._observe(s["name"], s["ms"] / 1000)
+            for key in self._counters:
+                self._counters[key] += int(data["attrs"].get(key, 0) or 0)
+
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(data, ensure_ascii=False) + "\n")
+
+    def _observe(self, stage: str, seconds: float) -> None:
+        counts = self._buckets.setdefault(stage, [0] * (len(DURATION_BUCKETS) + 1))
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                counts[i] += 1
+        counts[-1] += 1
+        self._sums[stage] = self._sums.get(stage, 0.0) + seconds
+
+    def prometheus_text(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP rag_stage_duration_seconds Time spent per RAG stage.",
+            "# TYPE rag_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            for stage in sorted(self._buckets):
+                counts = self._buckets[stage]
+                for bound, count in zip(DURATION_BUCKETS, counts):
+                    lines.append(
+                        f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {counts[-1]}'
+                )
+                lines.append(
+                    f'rag_stage_duration_seconds_sum{{stage="{stage}"}} {self._sums[stage]:.6f}'
+                )
+                lines.append(
+                    f'rag_stage_duration_seconds_count{{stage="{stage}"}} {counts[-1]}'
+                )
+
+            lines += [
+                "# HELP rag_requests_total Questions answered.",
+                "# TYPE rag_requests_total counter",
+                f"rag_requests_total {self._requests}",
+            ]
+            for key, value in self._counters.items():
+                lines += [
+                    f"# TYPE rag_{key}_total counter",
+                    f"rag_{key}_total {value}",
+                ]
+        return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(recorder: TraceRecorder, port: int, host: str = "127.0.0.1"):
+    """Serve recorder.prometheus_text() at http://host:port/metrics on a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = recorder.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # keep the Streamlit console quiet
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,113 @@
+"""
+Load / get throughput of VectorCollection at millions of ids.
+
+- Loading: upsert_vector() once per item (as callers did before, with and
+  without the old per-call print) vs. upsert_many() in batches.
+- Lookups: the global id -> partition index vs. the old lookup that
+  scanned every partition for the id.
+- How evenly the stable blake2b hash spreads auto-partitioned ids.
+
+Usage:
+    python benchmark_collection.py --n 2000000 --partitions 16
+    python benchmark_collection.py --n 2000000 --print-n 20000 > /dev/null
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from vectorpartition import VectorCollection
+
+
+def scan_lookup(collection, vector_id):
+    """The old get_vector(): try each partition in turn."""
+    for p_name, store in collection.partitions.items():
+        if vector_id in store:
+            return p_name, store.get(vector_id)
+    return None, None
+
+
+def new_collection(args):
+    return VectorCollection(
+        "bench",
+        args.dim,
+        default_num_partitions=args.partitions,
+        initial_capacity=args.n // args.partitions + 1,
+    )
+
+
+def report(label, n, seconds):
+    # stderr, so piping stdout away (see --print-n) keeps the results visible
+    print(f"  {label:<28} {n / seconds:12,.0f}/s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--n", type=int, default=2_000_000)
+    parser.add_argument("--dim", type=int, default=16)
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument(
+        "--print-n", type=int, default=20_000,
+        help="items loaded one by one with a print per item (the old behaviour)",
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.n, args.dim)).astype(np.float32)
+    ids = [f"doc-{i}" for i in range(args.n)]
+    metadatas = [{"i": i} for i in range(args.n)]
+    print(f"{args.n:,} ids, {args.partitions} partitions, dim {args.dim}", file=sys.stderr)
+
+    # 1) Old style: one call per item, printing a line each time
+    if args.print_n:
+        collection = new_collection(args)
+        t0 = time.perf_counter()
+        for vid, vec, meta in zip(ids[:args.print_n], vectors, metadatas):
+            collection.upsert_vector(vid, vec, meta)
+            print(f"[UPSERT] Inserted ID '{vid}' into partition '?'")
+        report("upsert_vector + print", args.print_n, time.perf_counter() - t0)
+
+    # 2) One call per item, no logging
+    collection = new_collection(args)
+    t0 = time.perf_counter()
+    for vid, vec, meta in zip(ids, vectors, metadatas):
+        collection.upsert_vector(vid, vec, meta)
+    report("upsert_vector (no logger)", args.n, time.perf_counter() - t0)
+
+    # 3) Bulk
+    collection = new_collection(args)
+    t0 = time.perf_counter()
+    for lo in range(0, args.n, args.batch_size):
+        hi = lo + args.batch_size
+        collection.upsert_many(ids[lo:hi], vectors[lo:hi], metadatas[lo:hi])
+    report(f"upsert_many (batch {args.batch_size:,})", args.n, time.perf_counter() - t0)
+
+    update_ids = [ids[i] for i in rng.integers(0, args.n, args.lookups)]
+    t0 = time.perf_counter()
+    collection.upsert_many(update_ids, vectors[:args.lookups], metadatas[:args.lookups])
+    report("upsert_many (updates)", args.lookups, time.perf_counter() - t0)
+
+    lookup_ids = [ids[i] for i in rng.integers(0, args.n, args.lookups)]
+    t0 = time.perf_counter()
+    for vid in lookup_ids:
+        collection.get_vector(vid)
+    report("get (id index)", args.lookups, time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    for vid in lookup_ids:
+        scan_lookup(collection, vid)
+    report("get (scan, old)", args.lookups, time.perf_counter() - t0)
+
+    sizes = np.array([len(store) for store in collection.partitions.values()])
+    print(
+        f"  partition sizes: min {sizes.min():,}  max {sizes.max():,}  "
+        f"(max/mean {sizes.max() / sizes.mean():.3f})",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
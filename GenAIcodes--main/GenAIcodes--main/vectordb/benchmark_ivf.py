@@ -0,0 +1,91 @@
+"""
+Recall vs. latency of the IVF index against the exact scan, on one partition.
+
+Synthetic 384-d data: a mixture of --clusters Gaussian blobs (uniform random
+vectors have no neighbourhood structure for k-means to exploit, unlike
+real embeddings). Queries come from the same mixture. For each nprobe the
+benchmark reports recall@top_k against the exact results, the median
+per-query latency and the share of rows each query scored.
+
+Usage:
+    python benchmark_ivf.py --n 200000 --dim 384 --nlist 512
+    python benchmark_ivf.py --nprobe 1 4 16 64
+"""
+import argparse
+import time
+
+import numpy as np
+
+from partition_store import PartitionStore
+
+
+def mixture(rng, n, centers, spread):
+    labels = rng.integers(0, len(centers), n)
+    noise = rng.standard_normal((n, centers.shape[1]), dtype=np.float32)
+    return centers[labels] + spread * noise
+
+
+def run_queries(store, queries, top_k, nprobe):
+    """(result id lists, median ms per query)."""
+    results, times = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        hits = store.search(q, top_k, nprobe=nprobe)
+        times.append((time.perf_counter() - t0) * 1000)
+        results.append([vid for vid, _ in hits])
+    return results, float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--n", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--spread", type=float, default=1.5,
+                        help="blob standard deviation (centers are N(0, 1))")
+    parser.add_argument("--nlist", type=int, default=512)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((args.clusters, args.dim), dtype=np.float32)
+    store = PartitionStore(args.dim, initial_capacity=args.n)
+    for lo in range(0, args.n, 50_000):
+        count = min(50_000, args.n - lo)
+        store.upsert_many(
+            [f"id-{i}" for i in range(lo, lo + count)],
+            mixture(rng, count, centers, args.spread),
+            [{} for _ in range(count)],
+        )
+    queries = mixture(rng, args.queries, centers, args.spread)
+
+    t0 = time.perf_counter()
+    store.create_ivf(nlist=args.nlist, nprobe=args.nprobe[0])
+    train_s = time.perf_counter() - t0
+
+    exact, exact_ms = run_queries(store, queries, args.top_k, nprobe=0)
+    truth = [set(ids) for ids in exact]
+
+    print(
+        f"{args.n:,} vectors x {args.dim} dims, {args.clusters} blobs, "
+        f"nlist={args.nlist}, top_k={args.top_k}, {args.queries} queries"
+    )
+    print(
+        f"  IVF training {train_s:.1f}s, list imbalance (max/mean) "
+        f"{store.ivf.imbalance():.2f}, index {store.ivf.nbytes() / 1e6:.1f} MB"
+    )
+    print(f"  {'nprobe':>7} {'recall':>7} {'ms/query':>9} {'speed-up':>9} {'scanned':>8}")
+    print(f"  {'exact':>7} {1.0:7.3f} {exact_ms:9.2f} {1.0:8.1f}x {100.0:7.1f}%")
+    for nprobe in args.nprobe:
+        approx, ms = run_queries(store, queries, args.top_k, nprobe=nprobe)
+        recall = np.mean([len(t & set(ids)) / len(t) for t, ids in zip(truth, approx)])
+        scanned = np.mean([len(rows) for rows in store.ivf.probe(queries, nprobe)]) / len(store)
+        print(
+            f"  {nprobe:7d} {recall:7.3f} {ms:9.2f} {exact_ms / ms:8.1f}x {100 * scanned:7.1f}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
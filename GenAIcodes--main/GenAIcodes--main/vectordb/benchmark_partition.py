@@ -0,0 +1,83 @@
+"""
+Search speed and memory of one partition: old dict-of-lists storage with a
+math.dist loop vs. PartitionStore (contiguous float32 + argpartition).
+
+Memory is what tracemalloc sees while the vectors are loaded; the old
+layout's cost is measured at --old-n vectors and scaled to --n because
+building millions of Python lists is slow.
+
+Usage:
+    python benchmark_partition.py --n 1000000 --dim 384
+"""
+import argparse
+import math
+import time
+import tracemalloc
+
+import numpy as np
+
+from partition_store import PartitionStore
+
+
+def old_search(store, query, top_k):
+    """The original search_in_partition() loop."""
+    results = [(vid, math.dist(query, rec["vector"])) for vid, rec in store.items()]
+    results.sort(key=lambda x: x[1])
+    return results[:top_k]
+
+
+def time_queries(fn, queries, repeat=1):
+    times = []
+    for q in queries:
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            fn(q)
+        times.append((time.perf_counter() - t0) * 1000 / repeat)
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--n", type=int, default=1_000_000)
+    parser.add_argument("--old-n", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=5)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+
+    # Old layout: {id: {"vector": [floats], "metadata": {}}}
+    old_vectors = rng.standard_normal((args.old_n, args.dim)).astype(np.float32)
+    tracemalloc.start()
+    old_store = {
+        f"id-{i}": {"vector": old_vectors[i].tolist(), "metadata": {}}
+        for i in range(args.old_n)
+    }
+    old_bytes = tracemalloc.get_traced_memory()[0] * args.n / args.old_n
+    tracemalloc.stop()
+    old_ms = time_queries(lambda q: old_search(old_store, q.tolist(), args.top_k), queries[:2])
+    old_ms *= args.n / args.old_n
+    old_store = old_vectors = None  # free before building the new layout
+
+    # New layout
+    tracemalloc.start()
+    store = PartitionStore(args.dim, initial_capacity=args.n)
+    for lo in range(0, args.n, 100_000):
+        block = rng.standard_normal((min(100_000, args.n - lo), args.dim)).astype(np.float32)
+        for i, vec in enumerate(block):
+            store.upsert(f"id-{lo + i}", vec, {})
+    new_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    new_ms = time_queries(lambda q: store.search(q, args.top_k), queries)
+
+    print(f"{args.n:,} vectors x {args.dim} dims, top_k={args.top_k}")
+    print(f"  {'':<16} {'search ms':>10} {'memory MB':>10}")
+    print(f"  {'dict + math.dist':<16} {old_ms:10.1f} {old_bytes / 1e6:10.1f}   (scaled from {args.old_n:,})")
+    print(f"  {'PartitionStore':<16} {new_ms:10.1f} {new_bytes / 1e6:10.1f}")
+    print(f"  speed-up x{old_ms / new_ms:,.0f}, memory /{old_bytes / new_bytes:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Memory reduction and recall loss of the sq8 / PQ codecs on one partition.
+
+The partition is saved and re-opened memory-mapped, so the float32
+originals stay on disk and only the codes (plus norms and codec tables)
+are held in memory. Each codec is measured twice: asymmetric distances on
+the codes alone, and with the best top_k * --rerank code matches re-ranked
+against the originals. Recall@top_k is relative to the exact float32 scan.
+
+Synthetic data: a mixture of Gaussian blobs (see benchmark_ivf.py).
+
+Usage:
+    python benchmark_quantization.py --n 200000 --dim 384
+    python benchmark_quantization.py --dim 768 --pq-m 96 192
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from partition_store import PartitionStore
+
+
+def mixture(rng, n, centers, spread):
+    labels = rng.integers(0, len(centers), n)
+    noise = rng.standard_normal((n, centers.shape[1]), dtype=np.float32)
+    return centers[labels] + spread * noise
+
+
+def run_queries(store, queries, top_k, rerank=None):
+    """(result id lists, median ms per query)."""
+    results, times = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        hits = store.search(q, top_k, rerank=rerank)
+        times.append((time.perf_counter() - t0) * 1000)
+        results.append([vid for vid, _ in hits])
+    return results, float(np.median(times))
+
+
+def recall(truth, results):
+    return float(np.mean([len(t & set(ids)) / len(t) for t, ids in zip(truth, results)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--n", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--spread", type=float, default=1.5)
+    parser.add_argument("--pq-m", type=int, nargs="+", default=[48, 96],
+                        help="PQ sub-vectors (bytes per vector); each must divide --dim")
+    parser.add_argument("--rerank", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((args.clusters, args.dim), dtype=np.float32)
+    store = PartitionStore(args.dim, initial_capacity=args.n)
+    for lo in range(0, args.n, 50_000):
+        count = min(50_000, args.n - lo)
+        store.upsert_many(
+            [f"id-{i}" for i in range(lo, lo + count)],
+            mixture(rng, count, centers, args.spread),
+            [{} for _ in range(count)],
+        )
+    queries = mixture(rng, args.queries, centers, args.spread)
+
+    exact, exact_ms = run_queries(store, queries, args.top_k)
+    truth = [set(ids) for ids in exact]
+    float_bytes = store.nbytes()
+
+    print(
+        f"{args.n:,} vectors x {args.dim} dims, top_k={args.top_k}, "
+        f"rerank={args.rerank} x top_k, {args.queries} queries"
+    )
+    print(
+        f"  {'codec':<8} {'B/vector':>8} {'RAM MB':>7} {'reduction':>9} "
+        f"{'recall':>7} {'ms':>6} {'+rerank':>8} {'ms':>6}"
+    )
+    print(
+        f"  {'float32':<8} {4 * args.dim:8d} {float_bytes / 1e6:7.1f} {1.0:8.1f}x "
+        f"{1.0:7.3f} {exact_ms:6.1f}"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prefix = os.path.join(tmp, "partition_0")
+        store.save(prefix)
+        store = None   # from here on the originals are only on disk
+
+        codecs = [("sq8", {})] + [("pq", {"m": m}) for m in args.pq_m]
+        for kind, params in codecs:
+            mapped = PartitionStore.open(prefix, args.dim)
+            t0 = time.perf_counter()
+            mapped.compress(kind, rerank=args.rerank, **params)
+            train_s = time.perf_counter() - t0
+
+            approx, approx_ms = run_queries(mapped, queries, args.top_k, rerank=0)
+            reranked, rerank_ms = run_queries(mapped, queries, args.top_k)
+            ram = mapped.nbytes()
+            label = kind if kind == "sq8" else f"pq{params['m']}"
+            print(
+                f"  {label:<8} {mapped.codec.code_size:8d} {ram / 1e6:7.1f} "
+                f"{float_bytes / ram:8.1f}x {recall(truth, approx):7.3f} {approx_ms:6.1f} "
+                f"{recall(truth, reranked):8.3f} {rerank_ms:6.1f}   (train+encode {train_s:.1f}s)"
+            )
+            mapped = None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Multi-core scaling of VectorCollection.search() across partitions.
+
+Fills --partitions partitions with random vectors, then times a batch of
+queries over all partitions with 1, 2, 4, ... search threads. BLAS is
+pinned to one thread per call (--blas-threads) so the speed-up comes from
+the partition thread pool, not from NumPy's own threading.
+
+Usage:
+    python benchmark_search.py --n 1000000 --dim 128 --partitions 8
+"""
+import argparse
+import os
+import sys
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--n", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--partitions", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=32, help="queries per search() call")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--blas-threads", type=int, default=1)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Must be set before NumPy loads its BLAS
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(args.blas_threads)
+    if "numpy" in sys.modules:
+        print("warning: NumPy already imported, --blas-threads may be ignored")
+
+    import numpy as np
+
+    from vectorpartition import VectorCollection
+
+    rng = np.random.default_rng(0)
+    collection = VectorCollection(
+        "bench",
+        args.dim,
+        default_num_partitions=args.partitions,
+        initial_capacity=args.n // args.partitions + 1,
+    )
+    # Bulk load through the collection so id_to_partition stays consistent
+    for lo in range(0, args.n, 100_000):
+        count = min(100_000, args.n - lo)
+        block = rng.standard_normal((count, args.dim)).astype(np.float32)
+        collection.upsert_many([f"doc-{i}" for i in range(lo, lo + count)], block)
+
+    queries = rng.standard_normal((args.batch, args.dim)).astype(np.float32)
+
+    print(
+        f"{len(collection.id_to_partition):,} vectors x {args.dim} dims in "
+        f"{args.partitions} partitions, batch of {args.batch} queries, top_k={args.top_k}"
+    )
+    print(f"  {'threads':>7} {'ms/batch':>9} {'queries/s':>10} {'speed-up':>9}")
+
+    base = None
+    workers = 1
+    while workers <= max(args.partitions, 1):
+        collection.close()
+        collection.max_workers = workers
+        collection.search(queries, args.top_k)  # warm-up (creates the pool)
+
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            collection.search(queries, args.top_k)
+        ms = (time.perf_counter() - t0) * 1000 / args.repeat
+        base = base or ms
+        print(
+            f"  {workers:7d} {ms:9.1f} {args.batch / ms * 1000:10,.0f} {base / ms:8.2f}x"
+        )
+        workers *= 2
+    collection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+from typing import List, Optional
+
+import numpy as np
+
+# -------------------------------------------------------------
+# IVF (inverted file) index for ONE partition (rows are PartitionStore rows).
+#
+#   centroids  - nlist k-means centroids (the "coarse quantizer")
+#   lists      - for each centroid, the rows whose vector is closest to it
+#
+# A search only scores the rows in the nprobe lists whose centroids are
+# closest to the query, instead of every row in the partition. More probes
+# means better recall and slower queries; nprobe = nlist is exact.
+#
+# The centroids are trained on the data present at training time. When
+# inserts drift away from that data the lists grow unevenly; once the
+# largest list is imbalance_threshold times the mean list size, the store
+# retrains: k-means warm-started from the current centroids, splitting the
+# oversized lists and dropping the smallest ones, then re-assigns every row.
+# -------------------------------------------------------------
+
+# Below nlist * MIN_POINTS_PER_LIST live rows the index stays untrained and
+# search falls back to the exact scan.
+MIN_POINTS_PER_LIST = 4
+
+# k-means trains on a random sample of at most nlist * MAX_POINTS_PER_LIST rows.
+MAX_POINTS_PER_LIST = 64
+
+# A rebalance is only considered after this share of the rows seen at the
+# last training has been added, moved or removed, so data that is skewed
+# from the start does not retrain on every write.
+REBALANCE_MIN_CHANGES = 0.1
+
+
+def nearest_centroid(
+    vectors: np.ndarray,
+    centroids: np.ndarray,
+    sq_norms: Optional[np.ndarray] = None,
+    chunk_size: int = 16384
+) -> np.ndarray:
+    """Index of the closest centroid for every vector (L2), in chunks to bound memory."""
+    if sq_norms is None:
+        sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for lo in range(0, len(vectors), chunk_size):
+        # ||x||^2 is the same for every centroid, so it does not change the argmin
+        dists = vectors[lo:lo + chunk_size] @ centroids.T
+        dists *= -2.0
+        dists += sq_norms
+        labels[lo:lo + chunk_size] = np.argmin(dists, axis=1)
+    return labels
+
+
+def kmeans(
+    data: np.ndarray,
+    k: int,
+    iterations: int = 10,
+    seed: int = 0,
+    init: Optional[np.ndarray] = None,
+    max_ratio: Optional[float] = None
+) -> np.ndarray:
+    """
+    Lloyd's k-means in NumPy: (k, dim) float32 centroids.
+
+    Starts from init (warm start) or from k random rows. A cluster that
+    ends up empty is re-seeded by splitting the largest cluster in two.
+    With max_ratio, every cluster holding more than max_ratio times the
+    mean cluster size is split the same way, using the centroid of the
+    currently smallest cluster (its rows move to their next-nearest one).
+    """
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    if init is not None:
+        centroids = np.array(init, dtype=np.float32)
+    else:
+        centroids = data[rng.choice(len(data), k, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = nearest_centroid(data, centroids)
+        counts = np.bincount(labels, minlength=k)
+
+        # Mean of each non-empty cluster: sort by label, sum each run
+        order = np.argsort(labels, kind="stable")
+        nonempty = np.flatnonzero(counts)
+        starts = (np.cumsum(counts) - counts)[nonempty]
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        centroids[nonempty] = sums / counts[nonempty, None]
+
+        reseed = list(np.flatnonzero(counts == 0))
+        if max_ratio is not None:
+            oversized = int(np.sum(counts > max_ratio * len(data) / k))
+            donors = [c for c in np.argsort(counts, kind="stable") if counts[c] > 0]
+            reseed += donors[:min(oversized, len(donors) - oversized)]
+
+        for small in reseed:
+            big = np.argmax(counts)
+            nudge = rng.choice([-1.0, 1.0], size=data.shape[1]).astype(np.float32) / 1024
+            centroids[small] = centroids[big] * (1 + nudge)
+            centroids[big] *= 1 - nudge
+            counts[small] = counts[big] // 2
+            counts[big] -= counts[small]
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted lists over PartitionStore rows.
+
+    list_rows[l][:list_sizes[l]] are the rows assigned to centroid l;
+    row_list / row_pos map a row back to its list and its slot in it, so a
+    row is removed in O(1) by moving the list's last row into its slot.
+    """
+
+    kind = "ivf"
+
+    def __init__(
+        self,
+        dim: int,
+        nlist: int = 256,
+        nprobe: int = 8,
+        imbalance_threshold: float = 3.0,
+        iterations: int = 10,
+        seed: int = 0
+    ):
+        """
+        :param dim:                 Vector dimension.
+        :param nlist:               Number of k-means centroids / inverted lists.
+        :param nprobe:              Lists scanned per query by default.
+        :param imbalance_threshold: Retrain once max list size / mean list size
+                                    passes this.
+        :param iterations:          k-means iterations per training.
+        :param seed:                Seed for the training sample and k-means init.
+        """
+        if nlist < 1 or nprobe < 1:
+            raise ValueError(f"nlist and nprobe must be >= 1, got nlist={nlist}, nprobe={nprobe}")
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.imbalance_threshold = imbalance_threshold
+        self.iterations = iterations
+        self.seed = seed
+
+        self.centroids: Optional[np.ndarray] = None
+        self.centroid_sq_norms: Optional[np.ndarray] = None
+        self.list_rows: List[np.ndarray] = []
+        self.list_sizes = np.zeros(nlist, dtype=np.int64)
+        self.row_list = np.full(0, -1, dtype=np.int64)   # -1 = not in any list
+        self.row_pos = np.zeros(0, dtype=np.int64)
+
+        self.trained_rows = 0   # rows assigned by the last training
+        self.changes = 0        # rows added, moved or removed since then
+
+    # -----------------------------
+    # Helper Methods
+    # -----------------------------
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def min_train_rows(self) -> int:
+        return self.nlist * MIN_POINTS_PER_LIST
+
+    def config(self) -> dict:
+        """Constructor arguments, as saved next to a partition."""
+        return {
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "imbalance_threshold": self.imbalance_threshold,
+            "iterations": self.iterations,
+            "seed": self.seed,
+        }
+
+    def _ensure_rows(self, n: int) -> None:
+        if n > len(self.row_list):
+            size = max(n, 2 * len(self.row_list))
+            row_list = np.full(size, -1, dtype=np.int64)
+            row_list[:len(self.row_list)] = self.row_list
+            row_pos = np.zeros(size, dtype=np.int64)
+            row_pos[:len(self.row_pos)] = self.row_pos
+            self.row_list, self.row_pos = row_list, row_pos
+
+    def _build_lists(self, rows: np.ndarray, labels: np.ndarray) -> None:
+        """Replace every list with rows grouped by label."""
+        order = np.argsort(labels, kind="stable")
+        sorted_rows = rows[order]
+        counts = np.bincount(labels, minlength=self.nlist)
+        starts = np.cumsum(counts) - counts
+
+        self.list_rows = [sorted_rows[s:s + c].copy() for s, c in zip(starts, counts)]
+        self.list_sizes = counts.astype(np.int64)
+        self.row_list = np.full(int(rows.max()) + 1 if len(rows) else 0, -1, dtype=np.int64)
+        self.row_pos = np.zeros(len(self.row_list), dtype=np.int64)
+        self.row_list[rows] = labels
+        self.row_pos[sorted_rows] = np.arange(len(rows)) - starts[labels[order]]
+
+    def _append(self, label: int, rows: np.ndarray) -> None:
+        size = self.list_sizes[label]
+        end = size + len(rows)
+        block = self.list_rows[label]
+        if end > len(block):
+            grown = np.empty(max(end, 2 * len(block), 8), dtype=np.int64)
+            grown[:size] = block[:size]
+            block = self.list_rows[label] = grown
+        block[size:end] = rows
+        self.row_list[rows] = label
+        self.row_pos[rows] = np.arange(size, end)
+        self.list_sizes[label] = end
+
+    # -----------------------------
+    # Core Operations
+    # -----------------------------
+
+    def train(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """
+        (Re)train the centroids on a sample of vectors and assign all rows.
+        A retrain starts from the current centroids and splits lists larger
+        than imbalance_threshold times the mean, so it mostly moves the
+        centroids whose lists drifted.
+
+        :param rows:    Row numbers of the vectors (the store's live rows).
+        :param vectors: (len(rows), dim) vectors.
+        """
+        if len(rows) < self.nlist:
+            raise ValueError(
+                f"IVF training needs at least nlist={self.nlist} vectors, got {len(rows)}"
+            )
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(rows), self.nlist * MAX_POINTS_PER_LIST)
+        if sample_size < len(rows):
+            sample = vectors[np.sort(rng.choice(len(rows), sample_size, replace=False))]
+        else:
+            sample = vectors
+        self.centroids = kmeans(
+            sample, self.nlist, self.iterations, self.seed,
+            init=self.centroids, max_ratio=self.imbalance_threshold,
+        )
+        self.centroid_sq_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+
+        rows = np.asarray(rows, dtype=np.int64)
+        self._build_lists(rows, nearest_centroid(vectors, self.centroids, self.centroid_sq_norms))
+        self.trained_rows = len(rows)
+        self.changes = 0
+
+    def reset(self) -> None:
+        """Drop the centroids and lists: untrained again, search falls back to the exact scan."""
+        self.centroids = None
+        self.centroid_sq_norms = None
+        self.list_rows = []
+        self.list_sizes = np.zeros(self.nlist, dtype=np.int64)
+        self.row_list = np.full(0, -1, dtype=np.int64)
+        self.row_pos = np.zeros(0, dtype=np.int64)
+        self.trained_rows = 0
+        self.changes = 0
+
+    def load(self, centroids: np.ndarray, rows: np.ndarray, labels: np.ndarray) -> None:
+        """Restore a trained state (centroids + row assignments) saved earlier."""
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.centroid_sq_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        self._build_lists(np.asarray(rows, dtype=np.int64), np.asarray(labels, dtype=np.int64))
+        self.trained_rows = len(rows)
+        self.changes = 0
+
+    def add(self, rows, vectors: np.ndarray) -> None:
+        """Assign rows (new, or re-written with a new vector) to their nearest list."""
+        if not self.trained:
+            return
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.int64))
+        self._ensure_rows(int(rows.max()) + 1)
+        self.remove(rows[self.row_list[rows] >= 0])
+
+        labels = nearest_centroid(
+            np.asarray(vectors, dtype=np.float32).reshape(len(rows), self.dim),
+            self.centroids,
+            self.centroid_sq_norms,
+        )
+        if len(rows) == 1:
+            self._append(int(labels[0]), rows)
+        else:
+            order = np.argsort(labels, kind="stable")
+            sorted_labels = labels[order]
+            bounds = np.flatnonzero(np.diff(sorted_labels)) + 1
+            for group in np.split(order, bounds):
+                self._append(int(labels[group[0]]), rows[group])
+        self.changes += len(rows)
+
+    def remove(self, rows) -> None:
+        """Take rows out of their lists (rows that are in none are ignored)."""
+        for row in np.atleast_1d(rows):
+            if row >= len(self.row_list) or self.row_list[row] < 0:
+                continue
+            label = self.row_list[row]
+            pos = self.row_pos[row]
+            last = self.list_sizes[label] - 1
+            block = self.list_rows[label]
+            moved = block[last]
+            block[pos] = moved
+            self.row_pos[moved] = pos
+            self.list_sizes[label] = last
+            self.row_list[row] = -1
+            self.changes += 1
+
+    def remap(self, keep: np.ndarray) -> None:
+        """After compaction: old row keep[i] is now row i."""
+        if not self.trained:
+            return
+        labels = self.row_list[keep] if len(keep) else np.zeros(0, dtype=np.int64)
+        rows = np.flatnonzero(labels >= 0)
+        self._build_lists(rows, labels[rows])
+
+    def nbytes(self) -> int:
+        """Bytes held by the centroids, lists and row maps."""
+        total = self.row_list.nbytes + self.row_pos.nbytes + self.list_sizes.nbytes
+        total += sum(block.nbytes for block in self.list_rows)
+        if self.centroids is not None:
+            total += self.centroids.nbytes + self.centroid_sq_norms.nbytes
+        return total
+
+    def imbalance(self) -> float:
+        """Largest list size / mean list size (1.0 = perfectly even)."""
+        total = int(self.list_sizes.sum())
+        if total == 0:
+            return 1.0
+        return float(self.list_sizes.max()) * self.nlist / total
+
+    def needs_rebalance(self) -> bool:
+        return (
+            self.trained
+            and self.changes >= REBALANCE_MIN_CHANGES * max(self.trained_rows, self.nlist)
+            and self.imbalance() > self.imbalance_threshold
+        )
+
+    def probe(self, queries: np.ndarray, nprobe: Optional[int] = None) -> List[np.ndarray]:
+        """Candidate rows per query: the contents of its nprobe nearest lists."""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        dists = queries @ self.centroids.T
+        dists *= -2.0
+        dists += self.centroid_sq_norms
+        if nprobe < self.nlist:
+            nearest = np.argpartition(dists, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            nearest = np.broadcast_to(np.arange(self.nlist), dists.shape)
+
+        candidates = []
+        for labels in nearest:
+            blocks = [self.list_rows[l][:self.list_sizes[l]] for l in labels]
+            candidates.append(np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.int64))
+        return candidates
@@ -0,0 +1,223 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# -------------------------------------------------------------
+# Metadata indexes for ONE partition (rows are PartitionStore rows).
+#
+#   EqualityIndex - value -> packed row bitmap (1 bit per row)
+#   RangeIndex    - numeric value per row + a lazily sorted copy, so a
+#                   range is two searchsorted() calls
+#
+# Filters use a small Chroma-like syntax:
+#   {"category": "fruit"}                         equality
+#   {"category": {"$in": ["fruit", "juice"]}}     any of
+#   {"price": {"$gte": 1.0, "$lt": 5.0}}          range
+# Several fields in one dict are ANDed.
+# -------------------------------------------------------------
+
+INDEX_KINDS = ("equality", "range")
+
+_RANGE_OPS = ("$gt", "$gte", "$lt", "$lte")
+_OPS = ("$eq", "$in") + _RANGE_OPS
+
+
+def parse_where(where: Dict[str, Any]) -> List[Tuple[str, str, Any]]:
+    """Turn a filter dict into [(field, op, operand)] conditions."""
+    conditions = []
+    for field, spec in where.items():
+        if isinstance(spec, dict):
+            for op, operand in spec.items():
+                if op not in _OPS:
+                    raise ValueError(
+                        f"Unknown filter operator '{op}' on '{field}'. Available: {list(_OPS)}"
+                    )
+                if op == "$in":
+                    if isinstance(operand, (str, bytes)) or not hasattr(operand, "__iter__"):
+                        raise ValueError(
+                            f"Filter operator '$in' on '{field}' needs a list of values, "
+                            f"got {type(operand).__name__}."
+                        )
+                    operand = list(operand)
+                conditions.append((field, op, operand))
+        else:
+            conditions.append((field, "$eq", spec))
+    return conditions
+
+
+def matches(metadata: Optional[Dict[str, Any]], field: str, op: str, operand) -> bool:
+    """Evaluate one condition on one metadata dict (used for unindexed fields)."""
+    if not metadata or field not in metadata:
+        return False
+    value = metadata[field]
+    try:
+        if op == "$eq":
+            return value == operand
+        if op == "$in":
+            return value in operand
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+        if op == "$lt":
+            return value < operand
+        return value <= operand
+    except TypeError:  # e.g. comparing a string with a number
+        return False
+
+
+class EqualityIndex:
+    """value -> packed bitmap of the rows holding that value."""
+
+    kind = "equality"
+
+    def __init__(self, field: str):
+        self.field = field
+        self.bitmaps: Dict[Any, np.ndarray] = {}
+
+    def check(self, metadata: Optional[Dict[str, Any]]) -> None:
+        """Raise ValueError if add() could not index this metadata."""
+        if not metadata or self.field not in metadata:
+            return
+        try:
+            hash(metadata[self.field])
+        except TypeError:
+            raise _unhashable(self.field, metadata[self.field])
+
+    def add(self, row: int, metadata: Optional[Dict[str, Any]]) -> None:
+        if not metadata or self.field not in metadata:
+            return
+        value = metadata[self.field]
+        try:
+            bits = self.bitmaps.get(value)
+        except TypeError:
+            raise _unhashable(self.field, value)
+
+        byte = row >> 3
+        if bits is None or len(bits) <= byte:
+            grown = np.zeros(max(byte + 1, 2 * len(bits) if bits is not None else 0), np.uint8)
+            if bits is not None:
+                grown[:len(bits)] = bits
+            bits = self.bitmaps[value] = grown
+        bits[byte] |= np.uint8(0x80 >> (row & 7))
+
+    def remove(self, row: int, metadata: Optional[Dict[str, Any]]) -> None:
+        if not metadata or self.field not in metadata:
+            return
+        bits = self.bitmaps.get(metadata[self.field])
+        if bits is not None and len(bits) > row >> 3:
+            bits[row >> 3] &= np.uint8(~(0x80 >> (row & 7)) & 0xFF)
+
+    def mask(self, op: str, operand, size: int) -> np.ndarray:
+        """Rows (bool[size]) whose value is operand ($eq) or in operand ($in)."""
+        values = operand if op == "$in" else [operand]
+        out = np.zeros(size, dtype=bool)
+        for value in values:
+            try:
+                bits = self.bitmaps.get(value)
+            except TypeError:  # unhashable: no row holds it (as in matches())
+                continue
+            if bits is not None:
+                unpacked = np.unpackbits(bits, count=min(size, len(bits) * 8)).view(bool)
+                out[:len(unpacked)] |= unpacked
+        return out
+
+    def rebuild(self, metadatas: List[Optional[Dict[str, Any]]]) -> None:
+        self.bitmaps = {}
+        for row, metadata in enumerate(metadatas):
+            self.add(row, metadata)
+
+
+class RangeIndex:
+    """Numeric value per row (NaN if missing) plus a sorted copy for range lookups."""
+
+    kind = "range"
+
+    def __init__(self, field: str):
+        self.field = field
+        self.values = np.full(0, np.nan, dtype=np.float64)
+        self._sorted_values: Optional[np.ndarray] = None
+        self._sorted_rows: Optional[np.ndarray] = None
+
+    def check(self, metadata: Optional[Dict[str, Any]]) -> None:
+        """Raise ValueError unless the field is missing, None or a number."""
+        if not metadata or metadata.get(self.field) is None:
+            return
+        value = metadata[self.field]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(
+                f"Metadata field '{self.field}' has a non-numeric value {value!r}; "
+                f"it cannot be range-indexed."
+            )
+
+    def _value(self, metadata) -> float:
+        if not metadata or self.field not in metadata:
+            return np.nan
+        value = metadata[self.field]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return np.nan
+        return float(value)
+
+    def add(self, row: int, metadata: Optional[Dict[str, Any]]) -> None:
+        if row >= len(self.values):
+            grown = np.full(max(row + 1, 2 * len(self.values)), np.nan, dtype=np.float64)
+            grown[:len(self.values)] = self.values
+            self.values = grown
+        self.values[row] = self._value(metadata)
+        self._sorted_values = None
+
+    def remove(self, row: int, metadata: Optional[Dict[str, Any]]) -> None:
+        if row < len(self.values):
+            self.values[row] = np.nan
+            self._sorted_values = None
+
+    def _ensure_sorted(self) -> None:
+        if self._sorted_values is None:
+            rows = np.flatnonzero(~np.isnan(self.values))
+            order = np.argsort(self.values[rows], kind="stable")
+            self._sorted_rows = rows[order]
+            self._sorted_values = self.values[self._sorted_rows]
+
+    def mask(self, op: str, operand, size: int) -> np.ndarray:
+        """Rows (bool[size]) whose value satisfies op operand."""
+        self._ensure_sorted()
+        values = self._sorted_values
+        if op == "$in":
+            operands = [float(v) for v in operand]
+        else:
+            operands = [float(operand)]
+
+        out = np.zeros(size, dtype=bool)
+        for x in operands:
+            if op in ("$eq", "$in"):
+                lo, hi = np.searchsorted(values, x, "left"), np.searchsorted(values, x, "right")
+            elif op == "$gt":
+                lo, hi = np.searchsorted(values, x, "right"), len(values)
+            elif op == "$gte":
+                lo, hi = np.searchsorted(values, x, "left"), len(values)
+            elif op == "$lt":
+                lo, hi = 0, np.searchsorted(values, x, "left")
+            else:
+                lo, hi = 0, np.searchsorted(values, x, "right")
+            rows = self._sorted_rows[lo:hi]
+            out[rows[rows < size]] = True
+        return out
+
+    def rebuild(self, metadatas: List[Optional[Dict[str, Any]]]) -> None:
+        self.values = np.full(len(metadatas), np.nan, dtype=np.float64)
+        for row, metadata in enumerate(metadatas):
+            self.values[row] = self._value(metadata)
+        self._sorted_values = None
+
+
+def _unhashable(field: str, value) -> ValueError:
+    return ValueError(
+        f"Metadata field '{field}' has an unhashable value {value!r}; "
+        f"it cannot be equality-indexed."
+    )
+
+
+def make_index(field: str, kind: str):
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Unknown index kind '{kind}'. Available: {list(INDEX_KINDS)}")
+    return EqualityIndex(field) if kind == "equality" else RangeIndex(field)
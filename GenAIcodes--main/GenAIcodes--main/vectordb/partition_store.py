@@ -0,0 +1,729 @@
+import itertools
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ivf_index import IVFIndex
+from metadata_index import make_index, matches, parse_where
+from quantization import MAX_TRAIN_ROWS, make_codec
+
+# A filter matching more than this share of live rows is applied after the
+# distance computation (full contiguous scan, non-matching rows masked out);
+# below it, only the matching rows are gathered and scored.
+PREFILTER_MAX_SELECTIVITY = 0.5
+
+# Rows per block when a whole partition is encoded or written to disk, so
+# memory stays bounded instead of growing with the partition.
+BLOCK_ROWS = 16384
+
+
+class PartitionStore:
+    """
+    Storage for ONE partition: a growable, contiguous float32 matrix.
+
+    - vectors[row] holds one vector; rows are appended at the end.
+    - id_to_row maps vector_id -> row, ids[row] maps back (None once deleted).
+    - Deletes only mark the row dead (a "tombstone"); when dead rows pass
+      compact_ratio of the used rows, compact() rewrites the matrix without them.
+    - Squared row norms are kept so an L2 search is one matrix-vector product.
+    - Optional metadata indexes (see metadata_index.py) map field values to
+      rows, so a filtered search only scores the rows that match.
+    - An optional IVF index (see ivf_index.py) groups rows around k-means
+      centroids, so a search can score only the lists nearest the query.
+    - An optional codec (see quantization.py) keeps a compact uint8 code per
+      row; search then scores the codes and re-ranks a shortlist with the
+      float32 vectors, which can stay on disk in a memory-mapped store.
+    - save() / open() persist the live rows as .npy files plus a JSON sidecar;
+      an opened store reads its vectors from a read-only memory map and
+      copies them into memory only on its first write.
+    - A compressed store never copies its memory-mapped vectors: writes go
+      to a small in-memory overflow block, and source[row] says where each
+      row's vector lives (>= 0: row of the map, < 0: overflow slot -1 - s).
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        initial_capacity: int = 1024,
+        compact_ratio: float = 0.25
+    ):
+        """
+        :param dim:              Vector dimension.
+        :param initial_capacity: Rows allocated up front (doubles when full).
+        :param compact_ratio:    Compact once this share of used rows is deleted.
+        """
+        self.dim = dim
+        self.compact_ratio = compact_ratio
+
+        capacity = max(1, initial_capacity)
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.sq_norms = np.empty(capacity, dtype=np.float32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.ids: List[Optional[str]] = []
+        self.metadatas: List[Optional[Dict[str, Any]]] = []
+        self.id_to_row: Dict[str, int] = {}
+        self.indexes: Dict[str, Any] = {}   # field -> EqualityIndex / RangeIndex
+        self.ivf: Optional[IVFIndex] = None
+        self.codec = None                        # ScalarQuantizer / ProductQuantizer
+        self.codes: Optional[np.ndarray] = None  # (capacity, codec.code_size) uint8
+        self.rerank = 0
+        self.source: Optional[np.ndarray] = None    # only while vectors stay mapped
+        self.overflow = np.empty((0, dim), dtype=np.float32)
+        self.overflow_size = 0
+
+        self.size = 0         # rows in use, including tombstones
+        self.tombstones = 0
+
+    # -----------------------------
+    # Helper Methods
+    # -----------------------------
+
+    def __len__(self) -> int:
+        return len(self.id_to_row)
+
+    def __contains__(self, vector_id: str) -> bool:
+        return vector_id in self.id_to_row
+
+    @property
+    def capacity(self) -> int:
+        return self.alive.shape[0]
+
+    def _grow(self, min_capacity: int) -> None:
+        """Re-allocate (doubling) so at least min_capacity rows fit."""
+        capacity = self.capacity
+        while capacity < min_capacity:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+
+        if self.source is None:
+            vectors = np.empty((capacity, self.dim), dtype=np.float32)
+            vectors[:self.size] = self.vectors[:self.size]
+            self.vectors = vectors
+        else:
+            source = np.zeros(capacity, dtype=np.int64)
+            source[:self.size] = self.source[:self.size]
+            self.source = source
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        sq_norms[:self.size] = self.sq_norms[:self.size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.size] = self.alive[:self.size]
+
+        self.sq_norms, self.alive = sq_norms, alive
+        if self.codes is not None:
+            codes = np.zeros((capacity, self.codes.shape[1]), dtype=np.uint8)
+            codes[:self.size] = self.codes[:self.size]
+            self.codes = codes
+
+    def _make_writable(self) -> None:
+        """
+        Copy memory-mapped (read-only) arrays into memory before a write.
+        A compressed store keeps its vectors mapped and switches to the
+        overflow block instead (see _write_vectors).
+        """
+        if not self.sq_norms.flags.writeable:
+            self.sq_norms = np.array(self.sq_norms)
+        if not self.vectors.flags.writeable and self.source is None:
+            if self.codec is not None:
+                self.source = np.arange(self.capacity, dtype=np.int64)
+            else:
+                self.vectors = np.array(self.vectors)
+
+    def _write_vectors(self, rows, vectors: np.ndarray) -> None:
+        """Store the vectors of rows: in the matrix, or in the overflow block while it is mapped."""
+        if self.source is None:
+            self.vectors[rows] = vectors
+            return
+
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.int64))
+        slots = -1 - self.source[rows]
+        fresh = np.flatnonzero(slots < 0)   # rows still pointing into the map (or new)
+        if len(fresh):
+            start = self.overflow_size
+            end = start + len(fresh)
+            if end > len(self.overflow):
+                grown = np.empty((max(end, 2 * len(self.overflow), 64), self.dim), dtype=np.float32)
+                grown[:start] = self.overflow[:start]
+                self.overflow = grown
+            slots[fresh] = np.arange(start, end)
+            self.source[rows[fresh]] = -1 - slots[fresh]
+            self.overflow_size = end
+        self.overflow[slots] = np.asarray(vectors, dtype=np.float32).reshape(len(rows), self.dim)
+
+    def _read_vectors(self, rows) -> np.ndarray:
+        """float32 vectors of rows (a copy), wherever they live."""
+        if self.source is None:
+            return self.vectors[rows]
+        source = self.source[rows]
+        mapped = source >= 0
+        out = np.empty((len(source), self.dim), dtype=np.float32)
+        out[mapped] = self.vectors[source[mapped]]
+        out[~mapped] = self.overflow[-1 - source[~mapped]]
+        return out
+
+    def check_metadatas(self, metadatas) -> None:
+        """
+        Raise ValueError if any metadata cannot go into this store's indexes,
+        so writes can validate before changing anything.
+        """
+        for index in self.indexes.values():
+            for metadata in metadatas:
+                index.check(metadata)
+
+    def _update_ivf(self) -> None:
+        """
+        Train the IVF index once enough rows exist; retrain it when its lists
+        drift out of balance. If deletes left too few rows to retrain, the
+        index goes back to untrained and search to the exact scan.
+        """
+        ivf = self.ivf
+        if ivf is None:
+            return
+        if not ivf.trained or ivf.needs_rebalance():
+            if len(self) >= max(ivf.nlist, ivf.min_train_rows):
+                rows = np.flatnonzero(self.alive[:self.size])
+                ivf.train(rows, self._read_vectors(rows))
+            elif ivf.trained:
+                ivf.reset()
+
+    # -----------------------------
+    # Core Operations
+    # -----------------------------
+
+    def upsert(self, vector_id: str, vector, metadata: Dict[str, Any]) -> bool:
+        """
+        Write the vector in place if the id exists, else append a row.
+        Returns True when a new row was inserted. Raises ValueError, leaving
+        the store unchanged, if the metadata cannot be indexed.
+        """
+        self.check_metadatas([metadata])
+        self._make_writable()
+        vector = np.asarray(vector, dtype=np.float32)
+        row = self.id_to_row.get(vector_id)
+        inserted = row is None
+        if inserted:
+            if self.size == self.capacity:
+                self._grow(self.size + 1)
+            row = self.size
+            self.size += 1
+            self.ids.append(vector_id)
+            self.metadatas.append(metadata)
+            self.id_to_row[vector_id] = row
+            self.alive[row] = True
+        else:
+            for index in self.indexes.values():
+                index.remove(row, self.metadatas[row])
+            self.metadatas[row] = metadata
+        for index in self.indexes.values():
+            index.add(row, metadata)
+
+        self._write_vectors(row, vector)
+        self.sq_norms[row] = np.dot(vector, vector)
+        if self.codec is not None:
+            self.codes[row] = self.codec.encode(vector[None, :])[0]
+        if self.ivf is not None:
+            self.ivf.add(row, vector)
+            self._update_ivf()
+        return inserted
+
+    def upsert_many(self, ids: List[str], vectors: np.ndarray, metadatas) -> Tuple[int, int]:
+        """
+        Bulk upsert of (n, dim) vectors: existing ids are overwritten in one
+        fancy-index assignment, new ids are appended as one block.
+        ids must be unique (VectorCollection.upsert_many() de-duplicates).
+        Returns (inserted, updated). All metadata is validated first: if any
+        of it cannot be indexed, ValueError is raised and nothing is written.
+        """
+        self.check_metadatas(metadatas)
+        self._make_writable()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # map() runs the dict lookups in C; a searchsorted over a sorted id
+        # array measured ~2x slower, before counting the cost of keeping it sorted
+        rows = np.fromiter(
+            map(self.id_to_row.get, ids, itertools.repeat(-1)), dtype=np.int64, count=len(ids)
+        )
+        existing = rows >= 0
+        norms = np.einsum("ij,ij->i", vectors, vectors)
+
+        # Updates: in place
+        upd = np.flatnonzero(existing)
+        if len(upd):
+            upd_rows = rows[upd]
+            self._write_vectors(upd_rows, vectors[upd])
+            self.sq_norms[upd_rows] = norms[upd]
+            if self.codec is not None:
+                self.codes[upd_rows] = self.codec.encode(vectors[upd])
+            for i, row in zip(upd, upd_rows):
+                for index in self.indexes.values():
+                    index.remove(row, self.metadatas[row])
+                    index.add(row, metadatas[i])
+                self.metadatas[row] = metadatas[i]
+
+        # Inserts: one append at the end
+        new = np.flatnonzero(~existing)
+        n = len(new)
+        if n:
+            start = self.size
+            if start + n > self.capacity:
+                self._grow(start + n)
+            self._write_vectors(np.arange(start, start + n), vectors[new])
+            self.sq_norms[start:start + n] = norms[new]
+            if self.codec is not None:
+                self.codes[start:start + n] = self.codec.encode(vectors[new])
+            self.alive[start:start + n] = True
+            new_ids = [ids[i] for i in new]
+            new_metas = [metadatas[i] for i in new]
+            self.ids.extend(new_ids)
+            self.metadatas.extend(new_metas)
+            self.id_to_row.update(zip(new_ids, range(start, start + n)))
+            self.size += n
+            for index in self.indexes.values():
+                for row, metadata in enumerate(new_metas, start):
+                    index.add(row, metadata)
+
+        if self.ivf is not None:
+            if len(upd):
+                self.ivf.add(upd_rows, vectors[upd])
+            if n:
+                self.ivf.add(np.arange(start, start + n), vectors[new])
+            self._update_ivf()
+        return n, len(upd)
+
+    def get(self, vector_id: str) -> Optional[Dict[str, Any]]:
+        """{"vector": [...], "metadata": {...}} for the id, or None."""
+        row = self.id_to_row.get(vector_id)
+        if row is None:
+            return None
+        return {"vector": self._read_vectors([row])[0].tolist(), "metadata": self.metadatas[row]}
+
+    def delete(self, vector_id: str) -> bool:
+        """Tombstone the id's row; compacts when enough rows are dead."""
+        row = self.id_to_row.pop(vector_id, None)
+        if row is None:
+            return False
+
+        self.alive[row] = False
+        for index in self.indexes.values():
+            index.remove(row, self.metadatas[row])
+        if self.ivf is not None:
+            self.ivf.remove(row)
+        self.ids[row] = None
+        self.metadatas[row] = None
+        self.tombstones += 1
+
+        if self.tombstones > self.compact_ratio * self.size:
+            self.compact()
+        self._update_ivf()
+        return True
+
+    def compact(self) -> None:
+        """Drop tombstoned rows, keeping live rows in their current order."""
+        if self.tombstones == 0:
+            return
+
+        self._make_writable()
+        keep = np.flatnonzero(self.alive[:self.size])
+        n = len(keep)
+        if self.source is None:
+            self.vectors[:n] = self.vectors[keep]
+        else:
+            self.source[:n] = source = self.source[keep]
+            moved = np.flatnonzero(source < 0)   # re-pack the overflow block too
+            self.overflow[:len(moved)] = self.overflow[-1 - source[moved]]
+            self.source[moved] = -1 - np.arange(len(moved))
+            self.overflow_size = len(moved)
+        self.sq_norms[:n] = self.sq_norms[keep]
+        if self.codes is not None:
+            self.codes[:n] = self.codes[keep]
+        self.alive[:n] = True
+        self.alive[n:self.size] = False
+
+        self.ids = [self.ids[row] for row in keep]
+        self.metadatas = [self.metadatas[row] for row in keep]
+        self.id_to_row = {vid: row for row, vid in enumerate(self.ids)}
+        self.size = n
+        self.tombstones = 0
+        for index in self.indexes.values():
+            index.rebuild(self.metadatas)
+        if self.ivf is not None:
+            self.ivf.remap(keep)
+
+    def create_index(self, field: str, kind: str = "equality") -> None:
+        """Index a metadata field ("equality" or "range") over the existing rows."""
+        index = make_index(field, kind)
+        index.rebuild(self.metadatas)
+        self.indexes[field] = index
+
+    def create_ivf(
+        self,
+        nlist: int = 256,
+        nprobe: int = 8,
+        imbalance_threshold: float = 3.0
+    ) -> None:
+        """
+        Add an IVF index (replacing any existing one). It is trained now if
+        the partition holds at least nlist * MIN_POINTS_PER_LIST rows, else
+        as soon as it does; until then search stays exact.
+        """
+        self.ivf = IVFIndex(self.dim, nlist, nprobe, imbalance_threshold)
+        self._update_ivf()
+
+    def compress(self, kind: str = "sq8", rerank: int = 4, **params) -> None:
+        """
+        Train a codec on a sample of the live rows and encode every row, in
+        blocks (replacing any existing codec). Later writes are encoded as
+        they come in; the float32 vectors are kept for re-ranking, and if
+        they are memory-mapped they stay on disk (see _write_vectors).
+
+        :param kind:   "sq8" (1 byte per dimension) or "pq" (m bytes per vector).
+        :param rerank: Re-score the best top_k * rerank code matches with the
+                       original vectors; 0 returns the approximate distances.
+        :param params: Codec options, e.g. m=48 for "pq".
+        """
+        codec = make_codec(self.dim, kind, **params)
+        rows = np.flatnonzero(self.alive[:self.size])
+        if len(rows) > MAX_TRAIN_ROWS:
+            # Gather only the training sample, not every live row
+            rng = np.random.default_rng(codec.seed)
+            rows = np.sort(rng.choice(rows, MAX_TRAIN_ROWS, replace=False))
+        codec.train(self._read_vectors(rows))
+
+        codes = np.zeros((self.capacity, codec.code_size), dtype=np.uint8)
+        for lo in range(0, self.size, BLOCK_ROWS):
+            hi = min(lo + BLOCK_ROWS, self.size)
+            codes[lo:hi] = codec.encode(self._read_vectors(np.arange(lo, hi)))
+        self.codec, self.codes, self.rerank = codec, codes, rerank
+
+    def filter_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """
+        Live rows (bool[size]) matching the filter. Indexed fields are looked
+        up in their index; other fields are checked record by record.
+        """
+        mask = self.alive[:self.size].copy()
+        for field, op, operand in parse_where(where):
+            index = self.indexes.get(field)
+            usable = index is not None and (
+                op in ("$eq", "$in") if index.kind == "equality" else _numeric(op, operand)
+            )
+            if usable:
+                mask &= index.mask(op, operand, self.size)
+            else:
+                rows = np.flatnonzero(mask)
+                keep = [matches(self.metadatas[row], field, op, operand) for row in rows]
+                mask[rows[~np.asarray(keep, dtype=bool)]] = False
+            if not mask.any():
+                break
+        return mask
+
+    def items(self):
+        """Yield (vector_id, record) for every live row, in row order."""
+        for row in np.flatnonzero(self.alive[:self.size]):
+            yield self.ids[row], {
+                "vector": self._read_vectors([row])[0].tolist(),
+                "metadata": self.metadatas[row],
+            }
+
+    def search(
+        self,
+        query_vector,
+        top_k: int = 3,
+        where=None,
+        nprobe: Optional[int] = None,
+        rerank: Optional[int] = None
+    ) -> List[Tuple[str, float]]:
+        """L2 search: (vector_id, distance) pairs, nearest first."""
+        return self.search_batch(
+            np.asarray(query_vector)[None, :], top_k, where, nprobe, rerank
+        )[0]
+
+    def search_batch(
+        self,
+        query_vectors,
+        top_k: int = 3,
+        where: Optional[Dict[str, Any]] = None,
+        nprobe: Optional[int] = None,
+        rerank: Optional[int] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        L2 search for several queries at once (one result list per query).
+
+        ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2 for all rows and queries in one
+        matrix product (NumPy releases the GIL inside it), then argpartition
+        picks each query's top_k without sorting the whole partition.
+
+        With a where filter, a selective filter gathers just the matching rows
+        before the product (pre-filter); a filter matching most rows keeps the
+        contiguous full scan and masks non-matching rows afterwards (post-filter).
+
+        With a trained IVF index the search is approximate: each query only
+        scores the rows in its nprobe nearest lists (default: the index's
+        nprobe). nprobe=0 skips the IVF lists and scans every row.
+
+        With a codec (see compress()) rows are scored on their codes, and the
+        best top_k * rerank are re-scored with the float32 vectors (default:
+        the store's rerank; 0 = no re-ranking, approximate distances).
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+
+        if where:
+            mask = self.filter_mask(where)
+            candidates = int(mask.sum())
+        else:
+            mask = None
+            candidates = len(self.id_to_row)
+        k = min(top_k, candidates)
+        if k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        if self.codec is not None:
+            return self._search_codes(queries, k, mask, nprobe, rerank)
+        if self.ivf is not None and self.ivf.trained and nprobe != 0:
+            return self._search_ivf(queries, k, mask, nprobe)
+
+        if mask is not None and candidates <= PREFILTER_MAX_SELECTIVITY * len(self.id_to_row):
+            rows = np.flatnonzero(mask)
+            vectors, sq_norms, excluded = self.vectors[rows], self.sq_norms[rows], None
+        else:
+            rows = None
+            vectors, sq_norms = self.vectors[:self.size], self.sq_norms[:self.size]
+            if mask is not None:
+                excluded = ~mask
+            elif self.tombstones:
+                excluded = ~self.alive[:self.size]
+            else:
+                excluded = None
+
+        dists = queries @ vectors.T
+        dists *= -2.0
+        dists += sq_norms
+        dists += np.einsum("ij,ij->i", queries, queries)[:, None]
+        if excluded is not None:
+            dists[:, excluded] = np.inf
+
+        top, top_dists = _smallest(dists, k)
+        if rows is not None:
+            top = rows[top]
+
+        return [
+            [(self.ids[row], float(dist)) for row, dist in zip(top_rows, row_dists)]
+            for top_rows, row_dists in zip(top, top_dists)
+        ]
+
+    def _search_ivf(self, queries, k, mask, nprobe) -> List[List[Tuple[str, float]]]:
+        """search_batch() through the IVF lists: gather each query's candidates and score them."""
+        results = []
+        for query, rows in zip(queries, self.ivf.probe(queries, nprobe)):
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if not len(rows):
+                results.append([])
+                continue
+            dists = self.vectors[rows] @ query
+            dists *= -2.0
+            dists += self.sq_norms[rows]
+            dists += np.dot(query, query)
+            top, top_dists = _smallest(dists[None, :], min(k, len(rows)))
+            results.append(
+                [(self.ids[row], float(dist)) for row, dist in zip(rows[top[0]], top_dists[0])]
+            )
+        return results
+
+    def _search_codes(self, queries, k, mask, nprobe, rerank) -> List[List[Tuple[str, float]]]:
+        """
+        search_batch() on the codes (asymmetric distances), then the re-rank
+        shortlist on the original vectors; only those rows of the vectors
+        are read, so a memory-mapped store pages in just them.
+        """
+        rerank = self.rerank if rerank is None else rerank
+        use_ivf = self.ivf is not None and self.ivf.trained and nprobe != 0
+        if use_ivf:
+            candidates = self.ivf.probe(queries, nprobe)
+        elif mask is None and not self.tombstones:
+            candidates = [None] * len(queries)   # every row: score the codes in place
+        else:
+            live = np.flatnonzero(mask if mask is not None else self.alive[:self.size])
+            candidates = [live] * len(queries)
+
+        results = []
+        for query, rows in zip(queries, candidates):
+            if rows is None:
+                rows = np.arange(self.size)
+                dists = self.codec.distances(query, self.codes[:self.size], self.sq_norms[:self.size])
+            else:
+                if use_ivf and mask is not None:
+                    rows = rows[mask[rows]]
+                if not len(rows):
+                    results.append([])
+                    continue
+                dists = self.codec.distances(query, self.codes[rows], self.sq_norms[rows])
+
+            top, top_dists = _smallest(dists[None, :], min(k * max(rerank, 1), len(rows)))
+            rows = rows[top[0]]
+            if rerank:
+                diff = self._read_vectors(rows) - query
+                top, top_dists = _smallest(np.einsum("ij,ij->i", diff, diff)[None, :], min(k, len(rows)))
+                rows = rows[top[0]]
+            results.append([(self.ids[row], float(dist)) for row, dist in zip(rows, top_dists[0])])
+        return results
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+
+    def save(self, prefix: str) -> None:
+        """
+        Write the live rows to prefix.vectors.npy / prefix.norms.npy and ids,
+        metadata and index fields to prefix.meta.json (tombstones are dropped).
+
+        Each file is written to a temp name and renamed, so saving over the
+        files this store is memory-mapped from is safe.
+        """
+        rows = np.flatnonzero(self.alive[:self.size])
+        # Vectors are copied block by block, never all at once
+        out = np.lib.format.open_memmap(
+            prefix + ".vectors.npy.tmp", mode="w+", dtype=np.float32, shape=(len(rows), self.dim)
+        )
+        for lo in range(0, len(rows), BLOCK_ROWS):
+            out[lo:lo + BLOCK_ROWS] = self._read_vectors(rows[lo:lo + BLOCK_ROWS])
+        out.flush()
+        del out
+        os.replace(prefix + ".vectors.npy.tmp", prefix + ".vectors.npy")
+        with open(prefix + ".norms.npy.tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(self.sq_norms[rows]))
+        os.replace(prefix + ".norms.npy.tmp", prefix + ".norms.npy")
+
+        with open(prefix + ".meta.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "ids": [self.ids[row] for row in rows],
+                    "metadatas": [self.metadatas[row] for row in rows],
+                    "indexes": {field: index.kind for field, index in self.indexes.items()},
+                    "ivf": self.ivf.config() if self.ivf is not None else None,
+                    "codec": (
+                        {**self.codec.config(), "rerank": self.rerank}
+                        if self.codec is not None else None
+                    ),
+                },
+                f,
+                separators=(",", ":"),
+            )
+        os.replace(prefix + ".meta.json.tmp", prefix + ".meta.json")
+
+        # Trained IVF state: centroids + list number of every saved row
+        if self.ivf is not None and self.ivf.trained:
+            with open(prefix + ".ivf.npz.tmp", "wb") as f:
+                np.savez(f, centroids=self.ivf.centroids, labels=self.ivf.row_list[rows])
+            os.replace(prefix + ".ivf.npz.tmp", prefix + ".ivf.npz")
+        elif os.path.exists(prefix + ".ivf.npz"):
+            os.remove(prefix + ".ivf.npz")
+
+        # Codec: its trained tables and the code of every saved row
+        if self.codec is not None:
+            with open(prefix + ".codes.npy.tmp", "wb") as f:
+                np.save(f, self.codes[rows])
+            os.replace(prefix + ".codes.npy.tmp", prefix + ".codes.npy")
+            with open(prefix + ".codec.npz.tmp", "wb") as f:
+                np.savez(f, **self.codec.state())
+            os.replace(prefix + ".codec.npz.tmp", prefix + ".codec.npz")
+        else:
+            for suffix in (".codes.npy", ".codec.npz"):
+                if os.path.exists(prefix + suffix):
+                    os.remove(prefix + suffix)
+
+    @classmethod
+    def open(
+        cls,
+        prefix: str,
+        dim: int,
+        mmap_mode: Optional[str] = "r",
+        compact_ratio: float = 0.25
+    ) -> "PartitionStore":
+        """
+        Load a store written by save(). With mmap_mode="r" the vectors stay
+        on disk (shared page cache between processes) until the first write.
+        """
+        vectors = np.load(prefix + ".vectors.npy", mmap_mode=mmap_mode)
+        sq_norms = np.load(prefix + ".norms.npy", mmap_mode=mmap_mode)
+        with open(prefix + ".meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        n = len(meta["ids"])
+        if vectors.shape != (n, dim) or sq_norms.shape != (n,):
+            raise ValueError(
+                f"Partition files at '{prefix}' disagree: {n} ids, vectors "
+                f"{vectors.shape}, norms {sq_norms.shape}, expected dim {dim}."
+            )
+
+        store = cls(dim, initial_capacity=1, compact_ratio=compact_ratio)
+        if n:
+            store.vectors, store.sq_norms = vectors, sq_norms
+            store.alive = np.ones(n, dtype=bool)
+        store.ids = list(meta["ids"])
+        store.metadatas = list(meta["metadatas"])
+        store.id_to_row = {vid: row for row, vid in enumerate(store.ids)}
+        store.size = n
+        for field, kind in meta.get("indexes", {}).items():
+            store.create_index(field, kind)
+
+        if meta.get("ivf"):
+            store.ivf = IVFIndex(dim, **meta["ivf"])
+            if os.path.exists(prefix + ".ivf.npz"):
+                with np.load(prefix + ".ivf.npz") as saved:
+                    store.ivf.load(saved["centroids"], np.arange(n), saved["labels"])
+            else:
+                store._update_ivf()
+
+        if meta.get("codec"):
+            params = dict(meta["codec"])
+            store.rerank = params.pop("rerank")
+            store.codec = make_codec(dim, **params)
+            with np.load(prefix + ".codec.npz") as saved:
+                store.codec.load(saved)
+            # Codes are small: always loaded into memory
+            codes = np.load(prefix + ".codes.npy")
+            store.codes = codes if n else np.zeros((store.capacity, codes.shape[1]), np.uint8)
+        return store
+
+    def nbytes(self) -> int:
+        """
+        Bytes held in memory by the NumPy arrays (allocated capacity, not just
+        live rows). Memory-mapped arrays are not counted.
+        """
+        arrays = [self.vectors, self.sq_norms, self.alive, self.overflow]
+        if self.codes is not None:
+            arrays.append(self.codes)
+        if self.source is not None:
+            arrays.append(self.source)
+        total = sum(a.nbytes for a in arrays if not isinstance(a, np.memmap))
+        if self.ivf is not None:
+            total += self.ivf.nbytes()
+        if self.codec is not None:
+            total += self.codec.nbytes()
+        return total
+
+
+def _smallest(dists: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per row of a (queries, candidates) squared-distance matrix: the k
+    smallest columns, nearest first, and their (non-squared) distances.
+    argpartition picks them without sorting every candidate.
+    """
+    n = dists.shape[1]
+    if k < n:
+        top = np.argpartition(dists, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(n), (len(dists), n))
+    top_dists = np.take_along_axis(dists, top, axis=1)
+    order = np.argsort(top_dists, axis=1, kind="stable")[:, :k]
+    top = np.take_along_axis(top, order, axis=1)
+    # Rounding can push an exact match slightly below zero
+    top_dists = np.sqrt(np.maximum(np.take_along_axis(top_dists, order, axis=1), 0.0))
+    return top, top_dists
+
+
+def _numeric(op: str, operand) -> bool:
+    """Whether a RangeIndex can answer this condition."""
+    values = operand if op == "$in" else [operand]
+    return all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values)
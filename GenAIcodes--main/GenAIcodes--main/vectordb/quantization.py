@@ -0,0 +1,194 @@
+from typing import Optional
+
+import numpy as np
+
+from ivf_index import kmeans
+
+# -------------------------------------------------------------
+# Vector codecs for ONE partition: compact codes kept in memory instead of
+# float32 vectors (4 bytes per dimension).
+#
+#   ScalarQuantizer  ("sq8") - each dimension mapped to 0..255 between its
+#                              trained min and max: 1 byte per dimension (4x)
+#   ProductQuantizer ("pq")  - the vector cut into m sub-vectors, each replaced
+#                              by the id of its nearest of 256 k-means
+#                              centroids: 1 byte per sub-vector (4*dim/m x)
+#
+# Search is asymmetric (ADC): the query stays float32 and is compared with
+# the codes directly, without decoding them to vectors.
+#   - sq8: q.x' = codes @ (q * scale) + q.offset, one matrix product.
+#   - pq:  a (m, 256) lookup table of ||q_j - centroid||^2 per sub-space is
+#          built once per query; a row's distance is the sum of m table
+#          entries picked by its codes.
+# The distances are approximate; PartitionStore can re-rank a shortlist
+# with the original vectors.
+# -------------------------------------------------------------
+
+CODEC_KINDS = ("sq8", "pq")
+
+# Codecs train on a random sample of at most this many rows.
+MAX_TRAIN_ROWS = 65536
+
+
+def _sample(vectors: np.ndarray, seed: int) -> np.ndarray:
+    if len(vectors) <= MAX_TRAIN_ROWS:
+        return np.asarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(vectors), MAX_TRAIN_ROWS, replace=False))
+    return np.asarray(vectors[rows], dtype=np.float32)
+
+
+class ScalarQuantizer:
+    """int8-style scalar quantization: one uint8 per dimension."""
+
+    kind = "sq8"
+
+    def __init__(self, dim: int, seed: int = 0):
+        self.dim = dim
+        self.seed = seed
+        self.code_size = dim
+        self.offset: Optional[np.ndarray] = None   # per-dimension minimum
+        self.scale: Optional[np.ndarray] = None    # per-dimension step
+
+    def config(self) -> dict:
+        return {"kind": self.kind, "seed": self.seed}
+
+    def state(self) -> dict:
+        return {"offset": self.offset, "scale": self.scale}
+
+    def load(self, state) -> None:
+        self.offset = np.asarray(state["offset"], dtype=np.float32)
+        self.scale = np.asarray(state["scale"], dtype=np.float32)
+
+    def train(self, vectors: np.ndarray) -> None:
+        sample = _sample(vectors, self.seed)
+        lo, hi = sample.min(axis=0), sample.max(axis=0)
+        self.offset = lo
+        self.scale = np.where(hi > lo, (hi - lo) / 255, 1.0).astype(np.float32)
+
+    def encode(self, vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return np.clip(np.rint((vectors - self.offset) / self.scale), 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes * self.scale + self.offset
+
+    def distances(
+        self,
+        query: np.ndarray,
+        codes: np.ndarray,
+        sq_norms: np.ndarray,
+        chunk_size: int = 512
+    ) -> np.ndarray:
+        """
+        Approximate squared L2 from query to every code row:
+        ||x||^2 - 2 q.x' + ||q||^2, with x' the decoded row and ||x||^2 the
+        stored norm of the original vector. Codes are widened to float32 in
+        small chunks that stay in cache.
+        """
+        weights = query * self.scale
+        dots = np.empty(len(codes), dtype=np.float32)
+        for lo in range(0, len(codes), chunk_size):
+            dots[lo:lo + chunk_size] = codes[lo:lo + chunk_size].astype(np.float32) @ weights
+        dots += np.dot(query, self.offset)
+        dists = sq_norms - 2.0 * dots
+        dists += np.dot(query, query)
+        return dists
+
+    def nbytes(self) -> int:
+        return 0 if self.scale is None else self.offset.nbytes + self.scale.nbytes
+
+
+class ProductQuantizer:
+    """Product quantization: m sub-vectors, one uint8 centroid id each."""
+
+    kind = "pq"
+    ksub = 256   # centroids per sub-space (one byte per code)
+
+    def __init__(self, dim: int, m: int = 8, iterations: int = 10, seed: int = 0):
+        """
+        :param dim:        Vector dimension; must be divisible by m.
+        :param m:          Sub-vectors per vector (= bytes per code).
+        :param iterations: k-means iterations per sub-space.
+        :param seed:       Seed for the training sample and k-means init.
+        """
+        if m < 1 or dim % m:
+            raise ValueError(f"PQ needs m to divide dim={dim}, got m={m}")
+        self.dim = dim
+        self.m = m
+        self.dsub = dim // m
+        self.iterations = iterations
+        self.seed = seed
+        self.code_size = m
+        self.centroids: Optional[np.ndarray] = None   # (m, ksub, dsub)
+
+    def config(self) -> dict:
+        return {"kind": self.kind, "m": self.m, "iterations": self.iterations, "seed": self.seed}
+
+    def state(self) -> dict:
+        return {"centroids": self.centroids}
+
+    def load(self, state) -> None:
+        self.centroids = np.asarray(state["centroids"], dtype=np.float32)
+
+    def _split(self, vectors) -> np.ndarray:
+        """(n, dim) -> (m, n, dsub) sub-vectors."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors.reshape(len(vectors), self.m, self.dsub).transpose(1, 0, 2)
+
+    def train(self, vectors: np.ndarray) -> None:
+        sample = _sample(vectors, self.seed)
+        if len(sample) < self.ksub:
+            raise ValueError(
+                f"PQ training needs at least {self.ksub} vectors, got {len(sample)}"
+            )
+        self.centroids = np.stack([
+            kmeans(sub, self.ksub, self.iterations, self.seed + j)
+            for j, sub in enumerate(self._split(sample))
+        ])
+
+    def encode(self, vectors) -> np.ndarray:
+        subs = self._split(vectors)
+        codes = np.empty((subs.shape[1], self.m), dtype=np.uint8)
+        for j in range(self.m):
+            centroids = self.centroids[j]
+            dists = subs[j] @ centroids.T
+            dists *= -2.0
+            dists += np.einsum("ij,ij->i", centroids, centroids)
+            codes[:, j] = np.argmin(dists, axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.centroids[j][codes[:, j]] for j in range(self.m)]
+        return np.concatenate(parts, axis=1)
+
+    def lookup_table(self, query: np.ndarray) -> np.ndarray:
+        """(m, ksub): squared distance from each query sub-vector to each centroid."""
+        diff = query.reshape(self.m, 1, self.dsub) - self.centroids
+        return np.einsum("mkd,mkd->mk", diff, diff)
+
+    def distances(
+        self,
+        query: np.ndarray,
+        codes: np.ndarray,
+        sq_norms: Optional[np.ndarray] = None,
+        chunk_size: int = 16384
+    ) -> np.ndarray:
+        """Approximate squared L2 from query to every code row (ADC, sum of table lookups)."""
+        table = self.lookup_table(query).astype(np.float32)
+        dists = np.zeros(len(codes), dtype=np.float32)
+        for lo in range(0, len(codes), chunk_size):
+            block = codes[lo:lo + chunk_size]
+            out = dists[lo:lo + chunk_size]
+            for j in range(self.m):
+                out += table[j][block[:, j]]
+        return dists
+
+    def nbytes(self) -> int:
+        return 0 if self.centroids is None else self.centroids.nbytes
+
+
+def make_codec(dim: int, kind: str, **params):
+    if kind not in CODEC_KINDS:
+        raise ValueError(f"Unknown codec '{kind}'. Available: {list(CODEC_KINDS)}")
+    return ScalarQuantizer(dim, **params) if kind == "sq8" else ProductQuantizer(dim, **params)
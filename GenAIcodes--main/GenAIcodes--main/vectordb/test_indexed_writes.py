@@ -0,0 +1,70 @@
+"""
+A write whose metadata cannot be indexed must raise and change nothing.
+
+Usage:
+    python -m pytest test_indexed_writes.py
+"""
+import numpy as np
+import pytest
+
+from vectorpartition import VectorCollection
+
+
+def make_collection():
+    collection = VectorCollection("test", 2, default_num_partitions=3)
+    collection.create_index("tag")
+    collection.create_index("price", kind="range")
+    collection.upsert_vector("ok", [0.0, 0.0], {"tag": "x", "price": 1.0})
+    return collection
+
+
+def test_upsert_vector_with_unhashable_value_changes_nothing():
+    collection = make_collection()
+
+    with pytest.raises(ValueError):
+        collection.upsert_vector("bad", [5.0, 5.0], {"tag": ["x", "y"]})
+
+    assert collection.get_vector("bad") == (None, None)
+    assert [vid for vid, _ in collection.search([5.0, 5.0], top_k=5)] == ["ok"]
+    assert sum(len(store) for store in collection.partitions.values()) == 1
+
+
+def test_update_with_non_numeric_range_value_keeps_old_record():
+    collection = make_collection()
+
+    with pytest.raises(ValueError):
+        collection.upsert_vector("ok", [1.0, 1.0], {"tag": "y", "price": "cheap"})
+
+    _, record = collection.get_vector("ok")
+    assert record == {"vector": [0.0, 0.0], "metadata": {"tag": "x", "price": 1.0}}
+    assert collection.search([0.0, 0.0], top_k=1, where={"tag": "x"})[0][0] == "ok"
+
+
+def test_upsert_many_with_one_bad_item_writes_nothing():
+    collection = make_collection()
+    ids = [f"id-{i}" for i in range(20)]
+    metadatas = [{"tag": "x", "price": float(i)} for i in range(20)]
+    metadatas[15] = {"tag": {"not": "hashable"}}
+
+    with pytest.raises(ValueError):
+        collection.upsert_many(ids, np.ones((20, 2)), metadatas)
+
+    assert list(collection.id_to_partition) == ["ok"]
+    assert sum(len(store) for store in collection.partitions.values()) == 1
+    assert [vid for vid, _ in collection.search([1.0, 1.0], top_k=5)] == ["ok"]
+
+
+def test_in_filter_rejects_a_string_operand():
+    collection = make_collection()
+
+    with pytest.raises(ValueError):
+        collection.search([0.0, 0.0], top_k=1, where={"tag": {"$in": "x"}})
+    with pytest.raises(ValueError):
+        collection.search([0.0, 0.0], top_k=1, where={"tag": {"$in": 3}})
+
+
+def test_eq_filter_with_unhashable_operand_matches_nothing():
+    collection = make_collection()
+
+    assert collection.search([0.0, 0.0], top_k=1, where={"tag": ["x"]}) == []
+    assert collection.search([0.0, 0.0], top_k=1, where={"tag": {"$in": [["x"], "x"]}})[0][0] == "ok"
@@ -0,0 +1,30 @@
+"""
+Deleting an IVF-indexed partition below nlist rows must not fail, and
+search must fall back to the exact scan.
+
+Usage:
+    python -m pytest test_ivf_deletes.py
+"""
+import numpy as np
+
+from vectorpartition import VectorCollection
+
+
+def test_delete_below_nlist_then_search():
+    rng = np.random.default_rng(0)
+    collection = VectorCollection("test", 8, default_num_partitions=1)
+    ids = [f"id-{i}" for i in range(200)]
+    vectors = rng.standard_normal((200, 8)).astype(np.float32)
+    collection.upsert_many(ids, vectors, [{} for _ in ids])
+    collection.create_ivf(nlist=16, nprobe=1)
+    (store,) = collection.partitions.values()
+    assert store.ivf.trained
+
+    for vid in ids[3:]:
+        assert collection.delete_vector(vid)
+
+    assert not store.ivf.trained
+    assert sorted(collection.id_to_partition) == ids[:3]
+    hits = collection.search(vectors[1], top_k=5)
+    assert [vid for vid, _ in hits][0] == "id-1"
+    assert sorted(vid for vid, _ in hits) == ids[:3]
@@ -1,5 +1,27 @@
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import operator
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional
-import math
+
+import numpy as np
+
+from partition_store import PartitionStore
+
+# Version of the on-disk layout written by VectorCollection.save()
+COLLECTION_FORMAT = 1
+COLLECTION_FILE = "collection.json"
+
+
+def stable_hash(vector_id: str) -> int:
+    """64-bit blake2b hash of an id: identical in every process and run."""
+    digest = hashlib.blake2b(vector_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
 
 
 class VectorCollection:
@@ -7,7 +29,19 @@ class VectorCollection:
     A simple in-memory "Collection" with NAMED partitions.
 
     - partitions is a dict:
-        partition_name (str) -> { id -> {"vector": [...], "metadata": {...}} }
+        partition_name (str) -> PartitionStore
+    - Each PartitionStore keeps its vectors in one contiguous float32 matrix
+      with an id -> row map (see partition_store.py), so a search is a
+      single matrix operation instead of a Python loop over records.
+    - id_to_partition maps every id to the partition holding it, so lookups
+      and updates never scan the partitions.
+    - create_ivf() adds an approximate IVF index to every partition, so a
+      search scores only the nprobe k-means lists nearest the query.
+    - compress() adds int8 scalar or product-quantization codes that search
+      scores instead of the float32 vectors; the vectors are kept for
+      re-ranking (memory-mapped, if the collection was opened from disk).
+    - save(path) / VectorCollection.open(path) persist it; opening
+      memory-maps the vectors instead of replaying upserts.
     """
 
     def __init__(
@@ -15,7 +49,10 @@ class VectorCollection:
         name: str,
         dim: int,
         partition_names: Optional[List[str]] = None,
-        default_num_partitions: int = 2
+        default_num_partitions: int = 2,
+        initial_capacity: int = 1024,
+        max_workers: Optional[int] = None,
+        logger: Optional[logging.Logger] = None
     ):
         """
         :param name:            Collection name (e.g., "products").
@@ -23,8 +60,15 @@ class VectorCollection:
         :param partition_names: Optional list of custom partition names.
                                 Example: ["fruits", "juices", "others"]
         :param default_num_partitions: Used only if partition_names is None.
+        :param initial_capacity: Rows pre-allocated per partition (grows as needed).
+        :param max_workers:     Threads for cross-partition search()
+                                (default: one per partition, up to the CPU count).
+        :param logger:          Optional logger for write events. Records carry
+                                the details as extra fields (event, vector_id,
+                                partition, counts); None means silent.
         """
         self.name = name
+        self.logger = logger
         self.dim = dim
 
         # If user provides custom names, use them.
@@ -36,11 +80,37 @@ class VectorCollection:
                 f"partition_{i}" for i in range(default_num_partitions)
             ]
 
-        # Map of partition_name -> {vector_id -> record}
-        self.partitions: Dict[str, Dict[str, Dict[str, Any]]] = {
-            pname: {} for pname in self.partition_names
+        # Map of partition_name -> contiguous storage for that partition
+        self.partitions: Dict[str, PartitionStore] = {
+            pname: PartitionStore(dim, initial_capacity)
+            for pname in self.partition_names
         }
 
+        # Global index: vector_id -> partition_name (kept in sync on every write)
+        self.id_to_partition: Dict[str, str] = {}
+
+        # Thread pool for search(), created on first use; close() shuts it down
+        self.max_workers = max_workers or min(len(self.partition_names), os.cpu_count() or 1)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def __enter__(self) -> "VectorCollection":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Shut down the search thread pool (waiting for running searches).
+        The collection stays usable: the next search() starts a new pool,
+        sized by the current max_workers.
+        """
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
     # -----------------------------
     # Helper Methods
     # -----------------------------
@@ -52,15 +122,44 @@ class VectorCollection:
                 f"Vector dimension mismatch. Expected {self.dim}, got {len(vector)}"
             )
 
+    def _log(self, message: str, *args, **fields) -> None:
+        """
+        Emit one structured record if a logger is set: message is a %-style
+        format that logging fills from args only when the record is emitted;
+        fields become extra attributes. Hot paths check self.logger first.
+        """
+        if self.logger is not None and self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(message, *args, extra={"collection": self.name, **fields})
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """The search thread pool, created once even if several threads race here."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=f"{self.name}-search"
+                )
+            return self._executor
+
+    def _require_partition(self, partition_name: str) -> PartitionStore:
+        if partition_name not in self.partitions:
+            raise ValueError(
+                f"Partition '{partition_name}' does not exist. "
+                f"Available: {list(self.partitions.keys())}"
+            )
+        return self.partitions[partition_name]
+
     def _choose_partition_automatically(self, vector_id: str) -> str:
         """
         Simple automatic partitioning rule:
-        - Use hash-based partitioning: hash(id) % number_of_partitions
+        - Use hash-based partitioning: blake2b(id) % number_of_partitions
+
+        blake2b gives the same answer in every process and on every run
+        (unlike the built-in hash(), which is randomized per process), so an
+        id always maps to the same partition.
 
         This is used ONLY when caller does NOT specify a partition_name.
         """
-        idx = hash(vector_id) % len(self.partition_names)
-        return self.partition_names[idx]
+        return self.partition_names[stable_hash(vector_id) % len(self.partition_names)]
 
     # -----------------------------
     # Core Operations
@@ -84,45 +183,208 @@ class VectorCollection:
         self._validate_vector(vector)
 
         # 1) Check if the ID already exists anywhere
-        for p_name, store in self.partitions.items():
-            if vector_id in store:
-                store[vector_id]["vector"] = vector
-                store[vector_id]["metadata"] = metadata
-                print(f"[UPSERT] Updated ID '{vector_id}' in partition '{p_name}'")
-                return
+        p_name = self.id_to_partition.get(vector_id)
+        if p_name is not None:
+            self.partitions[p_name].upsert(vector_id, vector, metadata)
+            if self.logger is not None:
+                self._log(
+                    "[UPSERT] Updated ID '%s' in partition '%s'", vector_id, p_name,
+                    event="update", vector_id=vector_id, partition=p_name,
+                )
+            return
 
         # 2) INSERT case
         if partition_name is not None:
-            if partition_name not in self.partitions:
-                raise ValueError(
-                    f"Partition '{partition_name}' does not exist. "
-                    f"Available: {list(self.partitions.keys())}"
-                )
+            self._require_partition(partition_name)
             target_partition = partition_name
         else:
             target_partition = self._choose_partition_automatically(vector_id)
 
-        self.partitions[target_partition][vector_id] = {
-            "vector": vector,
-            "metadata": metadata
-        }
-        print(f"[UPSERT] Inserted ID '{vector_id}' into partition '{target_partition}'")
+        self.partitions[target_partition].upsert(vector_id, vector, metadata)
+        self.id_to_partition[vector_id] = target_partition
+        if self.logger is not None:
+            self._log(
+                "[UPSERT] Inserted ID '%s' into partition '%s'", vector_id, target_partition,
+                event="insert", vector_id=vector_id, partition=target_partition,
+            )
+
+    def upsert_many(
+        self,
+        ids: List[str],
+        matrix,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        partition: Optional[str] = None
+    ) -> Dict[str, int]:
+        """
+        Bulk UPSERT: same rules as upsert_vector(), for many vectors at once.
+
+        - The (n, dim) matrix is validated once, not per vector.
+        - Existing ids are resolved through the id index in one pass; new ids
+          go to partition (if given) or to their hashed partition.
+        - Each partition then gets one bulk write (see PartitionStore.upsert_many).
+        - If an id appears more than once, the last occurrence wins.
+        - All metadata is validated against the partitions' indexes first; a
+          ValueError means nothing was written.
+
+        :param ids:        Vector ids, one per matrix row.
+        :param matrix:     (n, dim) array-like of vectors.
+        :param metadatas:  One metadata dict per row (default: empty dicts).
+        :param partition:  Partition for NEW ids; None means automatic.
+        :return: {"inserted": n, "updated": n}
+        """
+        vectors = np.asarray(matrix, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape != (len(ids), self.dim):
+            raise ValueError(
+                f"Matrix shape mismatch. Expected ({len(ids)}, {self.dim}), got {vectors.shape}"
+            )
+        if metadatas is None:
+            metadatas = [{} for _ in ids]
+        elif len(metadatas) != len(ids):
+            raise ValueError(f"Expected {len(ids)} metadatas, got {len(metadatas)}")
+        if partition is not None:
+            self._require_partition(partition)
+
+        # Keep the last occurrence of each id
+        last = {vid: i for i, vid in enumerate(ids)}
+        if len(last) != len(ids):
+            keep = np.fromiter(last.values(), dtype=np.int64, count=len(last))
+            keep.sort()
+            ids = [ids[i] for i in keep]
+            vectors = vectors[keep]
+            metadatas = [metadatas[i] for i in keep]
+
+        # Partition number per id: where it already lives, else the target
+        names = self.partition_names
+        number = {p_name: i for i, p_name in enumerate(names)}
+        codes = np.fromiter(
+            map(number.get, map(self.id_to_partition.get, ids), itertools.repeat(-1)),
+            dtype=np.int64,
+            count=len(ids),
+        )
+        new = np.flatnonzero(codes < 0)
+        if partition is not None:
+            codes[new] = number[partition]
+        elif len(new):
+            codes[new] = [stable_hash(ids[i]) % len(names) for i in new]
+
+        # Group rows by partition with one stable sort
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+        groups = [
+            (names[code], order[bounds[code]:bounds[code + 1]])
+            for code in range(len(names))
+            if bounds[code] < bounds[code + 1]
+        ]
+
+        # Validate every partition's share before writing any of them, so a
+        # bad batch leaves the collection unchanged
+        for p_name, rows in groups:
+            self.partitions[p_name].check_metadatas([metadatas[i] for i in rows])
+
+        self.id_to_partition.update((ids[i], names[codes[i]]) for i in new)
+        inserted = updated = 0
+        for p_name, rows in groups:
+            n_new, n_upd = self.partitions[p_name].upsert_many(
+                [ids[i] for i in rows], vectors[rows], [metadatas[i] for i in rows]
+            )
+            inserted += n_new
+            updated += n_upd
+
+        self._log(
+            "[UPSERT_MANY] %d inserted, %d updated across %d partition(s)",
+            inserted, updated, len(groups),
+            event="upsert_many", inserted=inserted, updated=updated, partitions=len(groups),
+        )
+        return {"inserted": inserted, "updated": updated}
 
     def get_vector(self, vector_id: str):
-        """Retrieve a vector by ID (searches all partitions)."""
-        for p_name, store in self.partitions.items():
-            if vector_id in store:
-                return p_name, store[vector_id]
-        return None, None
+        """Retrieve a vector by ID: (partition_name, record) or (None, None)."""
+        p_name = self.id_to_partition.get(vector_id)
+        if p_name is None:
+            return None, None
+        return p_name, self.partitions[p_name].get(vector_id)
+
+    def delete_vector(self, vector_id: str) -> bool:
+        """
+        Delete a vector by ID. The row is tombstoned and reclaimed by the
+        partition's next compaction.
+        """
+        p_name = self.id_to_partition.pop(vector_id, None)
+        if p_name is None:
+            return False
+        return self.partitions[p_name].delete(vector_id)
+
+    def compact(self) -> None:
+        """Reclaim tombstoned rows in every partition now."""
+        for store in self.partitions.values():
+            store.compact()
+
+    def create_index(self, field: str, kind: str = "equality") -> None:
+        """
+        Index a metadata field in every partition so search(where=...) can
+        skip non-matching rows.
+
+        :param field: Metadata key, e.g. "category" or "price".
+        :param kind:  "equality" (any hashable value) or "range" (numbers).
+        """
+        for store in self.partitions.values():
+            store.create_index(field, kind)
+
+    def create_ivf(
+        self,
+        nlist: int = 256,
+        nprobe: int = 8,
+        imbalance_threshold: float = 3.0,
+        partition_names: Optional[List[str]] = None
+    ) -> None:
+        """
+        Add an IVF (inverted file) index to partitions (default: all), making
+        their searches approximate (see ivf_index.py).
+
+        :param nlist:               k-means lists per partition; ~sqrt(rows) to
+                                    4*sqrt(rows) is a good start.
+        :param nprobe:              Lists scanned per query unless search()
+                                    overrides it.
+        :param imbalance_threshold: Retrain a partition's index once its largest
+                                    list passes this multiple of the mean.
+        """
+        names = self.partition_names if partition_names is None else partition_names
+        for p_name in names:
+            self._require_partition(p_name).create_ivf(nlist, nprobe, imbalance_threshold)
+
+    def compress(
+        self,
+        codec: str = "sq8",
+        rerank: int = 4,
+        partition_names: Optional[List[str]] = None,
+        **params
+    ) -> None:
+        """
+        Quantize partitions (default: all) so search scores compact codes
+        (see quantization.py):
+
+            "sq8"        1 byte per dimension         (4x smaller)
+            "pq", m=48   m bytes per vector           (4 * dim / m x smaller)
+
+        The float32 vectors are still needed to re-rank and to encode writes.
+        To keep them out of RAM, save() the collection and compress the one
+        returned by open(): its vectors stay memory-mapped, re-ranking reads
+        only the shortlisted rows, and later writes go to a small in-memory
+        block instead of copying the map. Save again to persist the codes
+        and the written vectors.
+
+        :param codec:  "sq8" or "pq".
+        :param rerank: Re-rank the best top_k * rerank code matches with the
+                       original vectors; 0 disables re-ranking.
+        :param params: Codec options, e.g. m=48 for "pq" (m must divide dim).
+        """
+        names = self.partition_names if partition_names is None else partition_names
+        for p_name in names:
+            self._require_partition(p_name).compress(codec, rerank, **params)
 
     def get_partition(self, partition_name: str) -> Dict[str, Dict[str, Any]]:
-        """Return the raw dictionary for a specific partition."""
-        if partition_name not in self.partitions:
-            raise ValueError(
-                f"Partition '{partition_name}' does not exist. "
-                f"Available: {list(self.partitions.keys())}"
-            )
-        return self.partitions[partition_name]
+        """Return a partition as {id -> {"vector": [...], "metadata": {...}}}."""
+        return dict(self._require_partition(partition_name).items())
 
     def print_collection_summary(self):
         """Print the number of vectors in each partition."""
@@ -138,26 +400,168 @@ class VectorCollection:
         self,
         partition_name: str,
         query_vector: List[float],
-        top_k: int = 3
+        top_k: int = 3,
+        where: Optional[Dict[str, Any]] = None,
+        nprobe: Optional[int] = None,
+        rerank: Optional[int] = None
     ):
-        """Brute-force L2 search inside ONE partition."""
+        """
+        L2 search inside ONE partition: [(id, distance)], nearest first.
+        where is an optional metadata filter (see metadata_index.py); nprobe
+        applies if the partition has an IVF index (0 = scan every row) and
+        rerank if it is compressed (see search()).
+        """
         self._validate_vector(query_vector)
+        return self._require_partition(partition_name).search(
+            query_vector, top_k, where, nprobe, rerank
+        )
 
-        if partition_name not in self.partitions:
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+
+    def save(self, path: str) -> None:
+        """
+        Write the collection to the directory path:
+
+            collection.json               name, dim, partition names
+            partition_<i>.vectors.npy     float32 vectors (live rows only)
+            partition_<i>.norms.npy       squared norms used by search
+            partition_<i>.meta.json       ids, metadata, indexed fields, IVF / codec settings
+            partition_<i>.ivf.npz         IVF centroids and list assignments (if trained)
+            partition_<i>.codes.npy       quantization codes (if compressed)
+            partition_<i>.codec.npz       quantizer tables (if compressed)
+
+        collection.json is written last, so an interrupted save cannot be
+        opened as a complete collection.
+        """
+        os.makedirs(path, exist_ok=True)
+        manifest_path = os.path.join(path, COLLECTION_FILE)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+        for i, p_name in enumerate(self.partition_names):
+            self.partitions[p_name].save(os.path.join(path, f"partition_{i}"))
+
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "format": COLLECTION_FORMAT,
+                    "name": self.name,
+                    "dim": self.dim,
+                    "partition_names": self.partition_names,
+                },
+                f,
+                indent=2,
+            )
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    @classmethod
+    def open(
+        cls,
+        path: str,
+        mmap_mode: Optional[str] = "r",
+        max_workers: Optional[int] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        Load a collection written by save().
+
+        With mmap_mode="r" (default) the vector files are memory-mapped, so
+        opening only reads ids and metadata, and several reader processes
+        share one copy in the OS page cache. A partition is copied into
+        memory the first time it is written to. Pass mmap_mode=None to load
+        everything into memory up front.
+        """
+        with open(os.path.join(path, COLLECTION_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != COLLECTION_FORMAT:
             raise ValueError(
-                f"Partition '{partition_name}' does not exist. "
-                f"Available: {list(self.partitions.keys())}"
+                f"Unsupported collection format {manifest.get('format')!r} at '{path}'. "
+                f"Available: [{COLLECTION_FORMAT}]"
+            )
+
+        collection = cls(
+            manifest["name"],
+            manifest["dim"],
+            partition_names=manifest["partition_names"],
+            initial_capacity=1,
+            max_workers=max_workers,
+            logger=logger,
+        )
+        for i, p_name in enumerate(collection.partition_names):
+            store = PartitionStore.open(
+                os.path.join(path, f"partition_{i}"), collection.dim, mmap_mode=mmap_mode
             )
+            collection.partitions[p_name] = store
+            for vid in store.ids:
+                collection.id_to_partition[vid] = p_name
+        return collection
 
-        store = self.partitions[partition_name]
-        results = []
+    def search(
+        self,
+        query_vectors,
+        top_k: int = 3,
+        partition_names: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        nprobe: Optional[int] = None,
+        rerank: Optional[int] = None
+    ):
+        """
+        L2 search across several partitions (default: all of them). Exact,
+        unless the partitions have an IVF index (see create_ivf()) or are
+        compressed (see compress()).
+
+        Every partition is scanned on the thread pool (the NumPy matrix
+        product releases the GIL, so partitions really run in parallel) and
+        the per-partition top_k lists are merged with a heap.
+
+        :param query_vectors:   One query vector, or a batch of them (2-D).
+        :param top_k:           Results per query.
+        :param partition_names: Partitions to search; None means all.
+        :param where:           Optional metadata filter, e.g.
+                                {"category": "fruit", "price": {"$lt": 5}}.
+        :param nprobe:          IVF lists scanned per partition (None = the
+                                index default, 0 = scan every row).
+        :param rerank:          For compressed partitions: re-rank the best
+                                top_k * rerank code matches with the original
+                                vectors (None = the compress() setting, 0 = off).
+        :return: [(id, distance)] nearest first for one query, or one such
+                 list per query for a batch.
+        """
+        names = self.partition_names if partition_names is None else partition_names
+        stores = [self._require_partition(p_name) for p_name in names]
+
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        single = queries.ndim == 1
+        if single:
+            queries = queries[None, :]
+        if queries.ndim != 2 or queries.shape[1] != self.dim:
+            raise ValueError(
+                f"Query dimension mismatch. Expected (n, {self.dim}), got {queries.shape}"
+            )
 
-        for vec_id, record in store.items():
-            dist = math.dist(query_vector, record["vector"])
-            results.append((vec_id, dist))
+        if len(stores) == 1:
+            per_partition = [stores[0].search_batch(queries, top_k, where, nprobe, rerank)]
+        else:
+            per_partition = list(
+                self._get_executor().map(
+                    lambda store: store.search_batch(queries, top_k, where, nprobe, rerank),
+                    stores,
+                )
+            )
 
-        results.sort(key=lambda x: x[1])  # sort by distance ascending
-        return results[:top_k]
+        merged = [
+            list(
+                itertools.islice(
+                    heapq.merge(*(results[q] for results in per_partition), key=operator.itemgetter(1)),
+                    top_k,
+                )
+            )
+            for q in range(len(queries))
+        ]
+        return merged[0] if single else merged
 
 
 # -------------------------------------------------------------
@@ -165,10 +569,13 @@ class VectorCollection:
 # -------------------------------------------------------------
 if __name__ == "__main__":
 
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
     collection = VectorCollection(
         name="products",
         dim=4,
-        partition_names=["fruits", "juices", "others"]
+        partition_names=["fruits", "juices", "others"],
+        logger=logging.getLogger("vectorpartition")
     )
 
     collection.upsert_vector("p1", [0.9, 0.1, 0.0, 0.0],
@@ -200,3 +607,11 @@ if __name__ == "__main__":
     for vid, dist in results:
         _, rec = collection.get_vector(vid)
         print(f"  ID={vid}, dist={dist:.4f}, name={rec['metadata']['name']}")
+
+    collection.create_index("category")
+    results = collection.search(query, top_k=2, where={"category": "juice"})
+
+    print("\nTop-2 nearest 'juice' items across all partitions:")
+    for vid, dist in results:
+        _, rec = collection.get_vector(vid)
+        print(f"  ID={vid}, dist={dist:.4f}, name={rec['metadata']['name']}")